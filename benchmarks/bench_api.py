@@ -0,0 +1,161 @@
+"""
+Time the API against a database filled by generate_data.py.
+
+Each scenario is run a few times after a warm up and the best, median and
+worst wall times are reported along with the number of records returned.
+Results are printed as one json record per line tagged with the git commit
+so runs can be compared with compare.py.
+
+Usage:
+    python benchmarks/bench_api.py --db localhost/test \\
+        --credentials tests/credentials.json > results.jsonl
+    python benchmarks/bench_api.py --scenarios from_filter raster_union
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import time
+from datetime import date
+
+from shapely.geometry import Point, box
+
+from snowexsql.api import (
+    LayerMeasurements, PointMeasurements, RasterMeasurements
+)
+from snowexsql.conversions import query_to_geopandas, raster_to_rasterio
+from snowexsql.db import get_db
+from snowexsql.tables import ImageData, PointData
+
+# Center of the generated data
+CENTER = Point(747500, 4325000)
+
+
+def scenarios(points, layers, rasters, engine, session):
+    """
+    Name and callable of each benchmark, the callables return the number of
+    records or rasters they fetched
+    """
+    def unique_entries():
+        points.clear_cache()
+        return len(points().all_types)
+
+    def point_query():
+        qry = session.query(PointData).filter(
+            PointData.type == "depth"
+        ).limit(100000)
+        return len(query_to_geopandas(qry, engine))
+
+    def raster_query():
+        qry = session.query(ImageData.raster.ST_AsTiff()).limit(10)
+        datasets = raster_to_rasterio(qry.all())
+        for d in datasets:
+            d.close()
+        return len(datasets)
+
+    def count_raster(dataset):
+        dataset.close()
+        return 1
+
+    return {
+        "from_filter": lambda: len(points.from_filter(
+            type="depth", site_name="Grand Mesa", limit=10000
+        )),
+        "from_filter_large": lambda: len(points.from_filter(
+            type="depth", limit=1000000
+        )),
+        "from_filter_dates": lambda: len(points.from_filter(
+            instrument="magnaprobe", date_greater_equal=date(2020, 1, 1),
+            date_less_equal=date(2020, 3, 1), limit=1000000
+        )),
+        "from_area_shape": lambda: len(points.from_area(
+            shp=CENTER.buffer(1000), type="depth", limit=1000000
+        )),
+        "from_area_pt_buffer": lambda: len(points.from_area(
+            pt=CENTER, buffer=1000, type="depth", limit=1000000
+        )),
+        "from_unique_entries": unique_entries,
+        "layers_from_filter": lambda: len(layers.from_filter(
+            type="density", site_name="Grand Mesa", limit=100000
+        )),
+        "raster_union": lambda: count_raster(rasters.from_area(
+            shp=box(740000, 4320000, 742000, 4322000), type="depth"
+        )),
+        "raster_union_rescaled": lambda: count_raster(rasters.from_area(
+            shp=box(740000, 4320000, 750000, 4330000), type="depth",
+            resolution=30
+        )),
+        "query_to_geopandas": point_query,
+        "raster_to_rasterio": raster_query,
+    }
+
+
+def timed(func, repeat):
+    """
+    Run func once to warm up then repeat times
+
+    Returns:
+        tuple: **records** - what func returned
+               **seconds** - list of wall times
+    """
+    records = func()
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    return records, seconds
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument("--db", default="localhost/test")
+    parser.add_argument("--credentials", default="tests/credentials.json")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scenarios", nargs="+",
+                        help="names of the scenarios to run, default all")
+    args = parser.parse_args()
+
+    with open(args.credentials) as fp:
+        creds = json.load(fp)
+    db_name = f"{creds['username']}:{creds['password']}@{args.db}"
+
+    class Points(PointMeasurements):
+        DB_NAME = db_name
+
+    class Layers(LayerMeasurements):
+        DB_NAME = db_name
+
+    class Rasters(RasterMeasurements):
+        DB_NAME = db_name
+
+    engine, session = get_db(
+        args.db, credentials=args.credentials, pooled=True
+    )
+    commit = git_commit()
+
+    try:
+        benchmarks = scenarios(Points, Layers, Rasters, engine, session)
+        for name in args.scenarios or benchmarks:
+            records, seconds = timed(benchmarks[name], args.repeat)
+            print(json.dumps(dict(
+                benchmark=name, commit=commit, records=records,
+                best=min(seconds), median=statistics.median(seconds),
+                worst=max(seconds), repeat=args.repeat
+            )), flush=True)
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark the geometry decoding used by query_to_geopandas.
+
+The row by row path mirrors geopandas.GeoDataFrame.from_postgis which decodes
+one hex string per geometry. The vectorized path decodes the EWKB bytes of the
+whole column with a single shapely.from_wkb call. Without a database only the
+decoding is timed. When a database is given both query_to_geopandas paths are
+timed end to end on the points table.
+
+Usage:
+    python benchmarks/bench_wkb_decoding.py --sizes 100000 1000000 10000000
+    python benchmarks/bench_wkb_decoding.py --db localhost/test \\
+        --credentials tests/credentials.json --sizes 100000
+
+Results are printed as one json record per line.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+import shapely.wkb
+
+
+def make_ewkb(n, srid=26912, seed=0):
+    """
+    Random UTM points encoded as EWKB bytes and hex strings
+    """
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(740000, 750000, n)
+    y = rng.uniform(4320000, 4330000, n)
+    points = shapely.set_srid(shapely.points(x, y), srid)
+    ewkb = shapely.to_wkb(points, include_srid=True)
+    ewkb_hex = shapely.to_wkb(points, hex=True, include_srid=True)
+    return ewkb, ewkb_hex
+
+
+def decode_row_by_row(ewkb_hex):
+    return pd.Series(ewkb_hex).apply(
+        lambda x: shapely.wkb.loads(str(x), hex=True)
+    )
+
+
+def decode_vectorized(ewkb):
+    return shapely.from_wkb(ewkb)
+
+
+def timed(func, *args, repeat=3):
+    """
+    Best wall time of a few runs in seconds
+    """
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_decoding(sizes, repeat):
+    for n in sizes:
+        ewkb, ewkb_hex = make_ewkb(n)
+        for name, func, data in [
+            ("row_by_row", decode_row_by_row, ewkb_hex),
+            ("vectorized", decode_vectorized, ewkb),
+        ]:
+            seconds = timed(func, data, repeat=repeat)
+            yield dict(
+                benchmark="wkb_decoding", path=name, rows=n,
+                seconds=seconds, rows_per_second=n / seconds
+            )
+
+
+def bench_query(db, credentials, sizes, repeat):
+    from snowexsql.conversions import query_to_geopandas
+    from snowexsql.db import get_db
+    from snowexsql.tables import PointData
+
+    engine, session = get_db(db, credentials=credentials)
+    try:
+        for n in sizes:
+            qry = session.query(PointData).limit(n)
+            for name, vectorized in [("row_by_row", False),
+                                     ("vectorized", True)]:
+                seconds = timed(
+                    query_to_geopandas, qry, engine, "geom", None,
+                    vectorized, repeat=repeat
+                )
+                yield dict(
+                    benchmark="query_to_geopandas", path=name, rows=n,
+                    seconds=seconds, rows_per_second=n / seconds
+                )
+    finally:
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10**5, 10**6, 10**7]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--db", help="database to time queries against")
+    parser.add_argument("--credentials", help="json file of credentials")
+    args = parser.parse_args()
+
+    if args.db is None:
+        records = bench_decoding(args.sizes, args.repeat)
+    else:
+        records = bench_query(
+            args.db, args.credentials, args.sizes, args.repeat
+        )
+
+    for record in records:
+        print(json.dumps(record), flush=True)
+
+
+if __name__ == "__main__":
+    main()
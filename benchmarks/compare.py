@@ -0,0 +1,54 @@
+"""
+Compare two runs of bench_api.py and flag the scenarios that got slower.
+
+Usage:
+    python benchmarks/compare.py baseline.jsonl results.jsonl --threshold 1.1
+
+Exits with 1 when any scenario's median is slower than the baseline by more
+than the threshold ratio.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    """
+    Records of a run keyed by benchmark name
+    """
+    with open(path) as fp:
+        records = [json.loads(line) for line in fp if line.strip()]
+    return {r["benchmark"]: r for r in records}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument("baseline")
+    parser.add_argument("results")
+    parser.add_argument("--threshold", type=float, default=1.1,
+                        help="median ratio above which a scenario regressed")
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    results = load(args.results)
+
+    regressed = False
+    print(f"{'benchmark':<25}{'baseline':>12}{'result':>12}{'ratio':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["median"] / baseline[name]["median"]
+        flag = ""
+        if ratio > args.threshold:
+            regressed = True
+            flag = "  slower"
+        print(
+            f"{name:<25}{baseline[name]['median']:>12.4f}"
+            f"{result['median']:>12.4f}{ratio:>8.2f}{flag}"
+        )
+
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Fill a database with synthetic SnowEx data for benchmarking.
+
+The records are generated inside postgres with generate_series so even the
+largest scales don't have to pass through python. Points are spread over a
+few sites and winters, pits have a realistic stack of layers for several
+profile types with a site record each, and the rasters are tiled like the
+lidar snow depths.
+
+Usage:
+    docker-compose up -d
+    python benchmarks/generate_data.py --db localhost/test \\
+        --credentials tests/credentials.json --points 1000000
+
+The tables are rebuilt first, so never point this at a database you want to
+keep.
+"""
+import argparse
+import json
+import time
+
+from sqlalchemy import text
+
+from snowexsql.db import get_db, initialize
+
+# Bounds of the generated data in UTM zone 12N, roughly Grand Mesa
+SRID = 26912
+X_MIN, X_MAX = 735000, 760000
+Y_MIN, Y_MAX = 4315000, 4335000
+
+SITE_NAMES = ["Grand Mesa", "Boise River Basin", "Cameron Pass",
+              "Fraser Experimental Forest", "Senator Beck"]
+POINT_TYPES = ["depth", "swe", "two_way_travel", "density"]
+POINT_INSTRUMENTS = ["magnaprobe", "mesa", "pit ruler", "camera", "gpr"]
+LAYER_TYPES = ["density", "temperature", "hand_hardness", "grain_size",
+               "lwc_a"]
+OBSERVERS = ["HP Marshall", "Chris Hiemstra", "Ryan Webb", "Megan Mason"]
+# First day of the winters the dates are spread over
+SEASONS = ["2019-10-01", "2020-10-01", "2021-10-01", "2022-10-01"]
+
+# Number of records inserted by a single statement
+BATCH_SIZE = 1000000
+
+
+def _pick(values, seed_expr):
+    """
+    SQL picking one of values with an integer expression
+    """
+    array = ", ".join("'{}'".format(v.replace("'", "''")) for v in values)
+    return f"(ARRAY[{array}])[1 + (({seed_expr}) % {len(values)})::int]"
+
+
+def _random_date():
+    # Any day in the December to April of one of the seasons
+    seasons = ", ".join(f"DATE '{s}'" for s in SEASONS)
+    return (
+        f"(ARRAY[{seasons}])[1 + floor(random() * {len(SEASONS)})::int]"
+        f" + 60 + floor(random() * 150)::int"
+    )
+
+
+def _random_point():
+    return (
+        f"ST_SetSRID(ST_MakePoint("
+        f"{X_MIN} + random() * {X_MAX - X_MIN}, "
+        f"{Y_MIN} + random() * {Y_MAX - Y_MIN}), {SRID})"
+    )
+
+
+def generate_points(conn, n):
+    """
+    Insert n point measurements in batches of BATCH_SIZE
+    """
+    for start in range(0, n, BATCH_SIZE):
+        stop = min(n, start + BATCH_SIZE)
+        conn.execute(text(f"""
+            INSERT INTO public.points (
+                site_name, date, time, doi, instrument, type, units,
+                observers, elevation, geom, site_id, version_number,
+                equipment, value
+            )
+            SELECT
+                {_pick(SITE_NAMES, "i / 1000")},
+                {_random_date()},
+                make_time(8 + i % 8, i % 60, 0),
+                'https://doi.org/10.5067/SNOWEX',
+                {_pick(POINT_INSTRUMENTS, "i / 7")},
+                {_pick(POINT_TYPES, "i")},
+                'cm',
+                {_pick(OBSERVERS, "i / 13")},
+                3000 + random() * 200,
+                {_random_point()},
+                NULL,
+                1,
+                'CRREL_' || i % 10,
+                random() * 200
+            FROM generate_series(:start, :stop - 1) AS i
+        """), dict(start=start, stop=stop))
+        conn.commit()
+
+
+def generate_sites(conn, pits):
+    """
+    Insert a site record for each pit
+    """
+    conn.execute(text(f"""
+        INSERT INTO public.sites (
+            site_name, date, time, doi, elevation, geom, site_id, pit_id,
+            slope_angle, aspect, air_temp, total_depth, weather_description,
+            sky_cover, ground_condition
+        )
+        SELECT
+            {_pick(SITE_NAMES, "p")},
+            {_random_date()},
+            make_time(8 + p % 8, p % 60, 0),
+            'https://doi.org/10.5067/SNOWEX',
+            3000 + random() * 200,
+            {_random_point()},
+            'S' || p,
+            'PIT' || p,
+            random() * 30,
+            random() * 360,
+            -10 + random() * 10,
+            50 + random() * 150,
+            'Sunny, cold',
+            'Few',
+            'Frozen'
+        FROM generate_series(0, :pits - 1) AS p
+    """), dict(pits=pits))
+    conn.commit()
+
+
+def generate_layers(conn, layers_per_pit):
+    """
+    Insert a profile of each layer type for every site, each with
+    layers_per_pit layers from the snow surface down to the ground
+    """
+    conn.execute(text(f"""
+        INSERT INTO public.layers (
+            site_name, date, time, doi, instrument, type, units, observers,
+            elevation, geom, site_id, pit_id, depth, bottom_depth, value
+        )
+        SELECT
+            s.site_name, s.date, s.time, s.doi,
+            CASE WHEN t.type = 'density' THEN 'Density Cutter' END,
+            t.type,
+            CASE WHEN t.type = 'density' THEN 'kg/m3'
+                 WHEN t.type = 'temperature' THEN 'deg C' END,
+            {_pick(OBSERVERS, "s.id")},
+            s.elevation, s.geom, s.site_id, s.pit_id,
+            s.total_depth * (1 - l / CAST(:layers AS float)),
+            s.total_depth * (1 - (l + 1) / CAST(:layers AS float)),
+            CASE WHEN t.type = 'density' THEN (100 + random() * 350)::text
+                 WHEN t.type = 'temperature' THEN (-10 + random() * 10)::text
+                 WHEN t.type = 'hand_hardness' THEN
+                     {_pick(["F", "4F", "1F", "P", "K"], "l")}
+                 WHEN t.type = 'grain_size' THEN
+                     {_pick(["< 1 mm", "1-2 mm", "2-4 mm"], "l")}
+                 ELSE (random() * 3)::text END
+        FROM public.sites AS s
+        CROSS JOIN unnest(
+            ARRAY[{", ".join(f"'{t}'" for t in LAYER_TYPES)}]
+        ) AS t(type)
+        CROSS JOIN generate_series(0, :layers - 1) AS l
+    """), dict(layers=layers_per_pit))
+    conn.commit()
+
+
+def generate_images(conn, tiles, tile_size, resolution=3):
+    """
+    Insert a snow depth raster cut into tiles x tiles tiles of
+    tile_size x tile_size pixels
+    """
+    span = tile_size * resolution
+    conn.execute(text(f"""
+        INSERT INTO public.images (
+            site_name, date, doi, instrument, type, units, observers,
+            description, raster
+        )
+        SELECT
+            'Grand Mesa', DATE '2020-02-01', 'https://doi.org/10.5067/ASO',
+            'lidar', 'depth', 'meters', 'ASO Inc.',
+            'Synthetic snow depth',
+            ST_MapAlgebra(
+                ST_AddBand(
+                    ST_MakeEmptyRaster(
+                        :size, :size,
+                        {X_MIN} + tx * :span, {Y_MAX} - ty * :span,
+                        :res, -:res, 0, 0, {SRID}
+                    ),
+                    '32BF'::text, 0, -9999
+                ),
+                1, '32BF',
+                '1 + 0.5 * sin(([rast.x] + ' || tx * :size || ') / 50.0)'
+                || ' * cos(([rast.y] + ' || ty * :size || ') / 50.0)'
+            )
+        FROM generate_series(0, :tiles - 1) AS tx
+        CROSS JOIN generate_series(0, :tiles - 1) AS ty
+    """), dict(size=tile_size, span=span, res=resolution, tiles=tiles))
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument("--db", default="localhost/test")
+    parser.add_argument("--credentials", default="tests/credentials.json")
+    parser.add_argument("--points", type=int, default=10**5,
+                        help="number of point records, 10^4 to 10^8")
+    parser.add_argument("--pits", type=int, default=1000)
+    parser.add_argument("--layers-per-pit", type=int, default=20)
+    parser.add_argument("--tiles", type=int, default=10,
+                        help="number of raster tiles along each side")
+    parser.add_argument("--tile-size", type=int, default=256)
+    parser.add_argument("--seed", type=float, default=0.5,
+                        help="seed for postgres random() between -1 and 1")
+    args = parser.parse_args()
+
+    engine, session = get_db(args.db, credentials=args.credentials)
+    session.close()
+    initialize(engine)
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT setseed(:seed)"), dict(seed=args.seed))
+        for table, func, func_args in [
+            ("points", generate_points, [args.points]),
+            ("sites", generate_sites, [args.pits]),
+            ("layers", generate_layers, [args.layers_per_pit]),
+            ("images", generate_images, [args.tiles, args.tile_size]),
+        ]:
+            start = time.perf_counter()
+            func(conn, *func_args)
+            conn.execute(text(f"ANALYZE public.{table}"))
+            conn.commit()
+            count = conn.execute(
+                text(f"SELECT count(*) FROM public.{table}")
+            ).scalar()
+            print(json.dumps(dict(
+                table=table, records=count,
+                seconds=time.perf_counter() - start
+            )), flush=True)
+
+
+if __name__ == "__main__":
+    main()
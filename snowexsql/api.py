@@ -1,16 +1,39 @@
+import json
 import logging
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from contextlib import contextmanager
+from contextvars import copy_context
+from datetime import timedelta
 
 import geoalchemy2.functions as gfunc
 import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
 from geoalchemy2.shape import from_shape
 from geoalchemy2.types import Raster
-from shapely.geometry import box
+from rasterio.crs import CRS
+from rasterio.transform import from_origin
+from shapely.geometry import Point, box
+from sqlalchemy import (
+    Float, Integer, LargeBinary, MetaData, Table, and_, null, select, text,
+    true, values
+)
+from sqlalchemy import column as sql_column
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.orm import Query
 from sqlalchemy.sql import func
 
-from snowexsql.conversions import query_to_geopandas, raster_to_rasterio
+from snowexsql.cache import MetadataCache, freeze_kwargs
+from snowexsql.conversions import (
+    array_to_rasterio, iter_query_to_geopandas, merge_rasterio,
+    query_to_geopandas, raster_to_rasterio
+)
 from snowexsql.db import get_db
-from snowexsql.tables import ImageData, LayerData, PointData
+from snowexsql.functions import Explain
+from snowexsql.stats import instrumented, query_stats
+from snowexsql.tables import ImageData, LayerData, PointData, RasterCatalog
 
 LOG = logging.getLogger(__name__)
 DB_NAME = 'snow:hackweek@db.snowexdata.org/snowex'
@@ -21,17 +44,34 @@ DB_NAME = 'snow:hackweek@db.snowexdata.org/snowex'
 #   * implement 'like' or 'contains' method
 
 
+# Shared by all the API classes, entries are keyed by database and table
+metadata_cache = MetadataCache()
+
+# Statistics available to BaseDataset.aggregate besides percentiles
+AGGREGATES = {
+    "count": func.count,
+    "mean": func.avg,
+    "std": func.stddev_samp,
+    "min": func.min,
+    "max": func.max,
+    "sum": func.sum,
+}
+
+
 class LargeQueryCheckException(RuntimeError):
     pass
 
 
 @contextmanager
-def db_session(db_name):
+def db_session(db_name, pooled=True):
     # use default_name
     db_name = db_name or DB_NAME
-    engine, session = get_db(db_name)
-    yield session, engine
-    session.close()
+    # Reuse the process wide connection pool unless told otherwise
+    engine, session = get_db(db_name, pooled=pooled)
+    try:
+        yield session, engine
+    finally:
+        session.close()
 
 
 def get_points():
@@ -53,6 +93,17 @@ class BaseDataset:
     SPECIAL_KWARGS = ["limit"]
     # Default max record count
     MAX_RECORD_COUNT = 1000
+    # How to check the record count before returning data. One of
+    # 'guard' (fetch at most MAX_RECORD_COUNT + 1 records), 'estimate'
+    # (use the planner's estimate) or 'count' (count the records first)
+    SIZE_CHECK_MODE = "guard"
+    # Cache for unique values used in filtering, set to None to disable
+    METADATA_CACHE = metadata_cache
+    # Default number of concurrent queries for from_filter_parallel
+    PARALLEL_WORKERS = 4
+    # Local cache of query results, e.g. snowexsql.cache.ResultCache(),
+    # disabled by default
+    RESULT_CACHE = None
 
     @staticmethod
     def build_box(xmin, ymin, xmax, ymax, crs):
@@ -61,6 +112,26 @@ class BaseDataset:
             geometry=[box(xmin, ymin, xmax, ymax)]
         ).set_crs(crs)
 
+    @staticmethod
+    def _buffered_point(pt, buffer, crs):
+        """
+        SQL expression of a point buffered in the database, it is built
+        inline so the buffer doesn't cost a separate round trip
+        """
+        return gfunc.ST_SetSRID(
+            func.ST_Buffer(from_shape(pt), buffer), int(crs)
+        )
+
+    @staticmethod
+    def _check_area_args(shp=None, pt=None, buffer=None):
+        if shp is None and pt is None:
+            raise ValueError(
+                "Inputs must be a shape description or a point and buffer"
+            )
+        if (pt is not None and buffer is None) or \
+                (buffer is not None and pt is None):
+            raise ValueError("pt and buffer must be given together")
+
     @staticmethod
     def retrieve_single_value_result(result):
         """
@@ -73,17 +144,93 @@ class BaseDataset:
         return final
 
     @classmethod
-    def _check_size(cls, qry, kwargs):
-        # Safeguard against accidental giant requests
-        count = qry.count()
-        if count > cls.MAX_RECORD_COUNT and "limit" not in kwargs:
-            raise LargeQueryCheckException(
-                f"Query will return {count} number of records,"
-                f" but we have a default max of {cls.MAX_RECORD_COUNT}."
-                f" If you want to proceed, set the 'limit' filter"
-                f" to the desired number of records."
+    def _raise_large_query(cls, description):
+        raise LargeQueryCheckException(
+            f"Query {description},"
+            f" but we have a default max of {cls.MAX_RECORD_COUNT}."
+            f" If you want to proceed, set the 'limit' filter"
+            f" to the desired number of records."
+        )
+
+    @classmethod
+    def _estimate_count(cls, qry):
+        """
+        Use the planner's row estimate for a query without running it
+        """
+        plan = qry.session.execute(Explain(qry.statement)).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    @classmethod
+    def _check_size(cls, qry, kwargs, guard=False):
+        """
+        Safeguard against accidental giant requests. Depending on
+        SIZE_CHECK_MODE this either counts the records, asks the planner
+        for an estimate or limits the query to one more record than allowed
+        so the check can happen on the results in the same round trip.
+
+        Args:
+            qry: the query to check
+            kwargs: the filters of the query
+            guard: Boolean, True when the caller checks the results with
+                   _check_result_size. Otherwise the guard mode counts the
+                   records instead so too many always raise here.
+        Returns:
+            qry: the query to execute
+        """
+        if "limit" in kwargs:
+            return qry
+
+        mode = cls.SIZE_CHECK_MODE
+        if mode == "guard" and not guard:
+            mode = "count"
+
+        if mode == "guard":
+            # Checked after fetching with _check_result_size
+            qry = qry.limit(cls.MAX_RECORD_COUNT + 1)
+
+        elif mode == "estimate":
+            with query_stats.phase("size_check"):
+                count = cls._estimate_count(qry)
+            if count > cls.MAX_RECORD_COUNT:
+                cls._raise_large_query(
+                    f"is estimated to return {count} number of records"
+                )
+
+        elif mode == "count":
+            with query_stats.phase("size_check"):
+                count = qry.count()
+            if count > cls.MAX_RECORD_COUNT:
+                cls._raise_large_query(
+                    f"will return {count} number of records"
+                )
+        else:
+            raise ValueError(
+                f"{cls.SIZE_CHECK_MODE} is not an allowed size check mode"
             )
 
+        return qry
+
+    @classmethod
+    def _check_result_size(cls, results, kwargs):
+        """
+        Finish the size check of a guarded query, the extra record only
+        shows up when the query was going to return too many.
+        """
+        if cls.SIZE_CHECK_MODE == "guard" and "limit" not in kwargs:
+            if len(results) > cls.MAX_RECORD_COUNT:
+                cls._raise_large_query(
+                    "will return more than the max number of records"
+                )
+
+    @classmethod
+    def _range_column(cls, key):
+        """
+        Column compared by the _greater_equal and _less_equal filters
+        """
+        return getattr(cls.MODEL, key)
+
     @classmethod
     def extend_qry(cls, qry, check_size=True, **kwargs):
         if cls.MODEL is None:
@@ -113,11 +260,11 @@ class BaseDataset:
                     # Filter boundary
                     if "_greater_equal" in k:
                         key = k.split("_greater_equal")[0]
-                        filter_col = getattr(cls.MODEL, key)
+                        filter_col = cls._range_column(key)
                         qry = qry.filter(filter_col >= v)
                     elif "_less_equal" in k:
                         key = k.split("_less_equal")[0]
-                        filter_col = getattr(cls.MODEL, key)
+                        filter_col = cls._range_column(key)
                         qry = qry.filter(filter_col <= v)
                     # Filter to exact value
                     else:
@@ -136,21 +283,101 @@ class BaseDataset:
                 raise ValueError(f"{k} is not an allowed filter")
 
         if check_size:
-            cls._check_size(qry, kwargs)
+            qry = cls._check_size(qry, kwargs)
 
         return qry
 
     @classmethod
+    def _table_key(cls):
+        """Identify the table of this class in the metadata cache"""
+        return cls.DB_NAME, cls.MODEL.__tablename__
+
+    @classmethod
+    def _table_fingerprint(cls, session):
+        """
+        Latest creation and update times of the table, these change when
+        data is added or modified
+        """
+        qry = session.query(
+            func.max(cls.MODEL.time_created), func.max(cls.MODEL.time_updated)
+        )
+        return tuple(qry.one())
+
+    @classmethod
+    def _result_fingerprint(cls, session):
+        """
+        Record count and latest update time of the table, cached results
+        are only used while these are unchanged
+        """
+        qry = session.query(func.count(), func.max(cls.MODEL.time_updated))
+        return tuple(qry.select_from(cls.MODEL).one())
+
+    @classmethod
+    def _cached_result(cls, session, fetch, kind, kwargs, geometries=None):
+        """
+        Return the result of fetch from RESULT_CACHE when it was stored
+        while the table looked the same, otherwise fetch and store it
+
+        Args:
+            session: database session for the fingerprint query
+            fetch: callable returning the GeoDataFrame for the request
+            kind: name of the request, part of the cache key
+            kwargs: filter kwargs of the request
+            geometries: shapely geometries used to filter the request
+        Returns: Geopandas dataframe of results
+        """
+        cache = cls.RESULT_CACHE
+        if cache is None:
+            return fetch()
+
+        key = cache.make_key(cls._table_key(), kind, kwargs, geometries)
+        with query_stats.phase("result_cache"):
+            fingerprint = cache.fingerprint(
+                cls._table_key(), lambda: cls._result_fingerprint(session)
+            )
+            df = cache.get(key, fingerprint)
+        if df is None:
+            df = fetch()
+            cache.set(key, fingerprint, df)
+        else:
+            LOG.debug(f"Using cached result {key}")
+
+        return df
+
+    @classmethod
+    def clear_cache(cls):
+        """Remove any cached metadata for this class's table"""
+        if cls.METADATA_CACHE is not None:
+            cls.METADATA_CACHE.invalidate(cls._table_key())
+
+    @classmethod
+    @instrumented
     def from_unique_entries(cls, columns_to_search, **kwargs):
         """Returns unique values from a column to help with filtering"""
         columns = [getattr(cls.MODEL, column) for column in columns_to_search]
+        cache = cls.METADATA_CACHE
+        key = (
+            cls._table_key(), "unique", tuple(columns_to_search),
+            freeze_kwargs(kwargs)
+        )
 
         with db_session(cls.DB_NAME) as (session, engine):
             try:
-                qry = session.query(*columns)
-                # Hardcode the limit to
-                qry = cls.extend_qry(qry, check_size=False, **kwargs)
-                results = qry.distinct().all()
+                results = None
+                if cache is not None:
+                    cache.validate(
+                        cls._table_key(),
+                        lambda: cls._table_fingerprint(session)
+                    )
+                    results = cache.get(key)
+
+                if results is None:
+                    qry = session.query(*columns)
+                    # Hardcode the limit to
+                    qry = cls.extend_qry(qry, check_size=False, **kwargs)
+                    results = qry.distinct().all()
+                    if cache is not None:
+                        cache.set(key, results)
 
             except Exception as e:
                 session.close()
@@ -159,68 +386,336 @@ class BaseDataset:
 
         if len(columns_to_search) == 1:
             results = cls.retrieve_single_value_result(results)
+        else:
+            results = list(results)
 
         return results
 
+    @classmethod
+    def _catalog_columns(cls):
+        """
+        Names of the columns that can be filtered to an exact value
+        """
+        columns = []
+        for k in cls.ALLOWED_QRY_KWARGS:
+            if "_equal" not in k and hasattr(cls.MODEL, k):
+                columns.append(k)
+        return columns
+
+    @classmethod
+    @instrumented
+    def catalog(cls, **kwargs):
+        """
+        Returns the unique values and the number of records for each of
+        them for every filterable column using a single query.
+
+        Args:
+            kwargs: for filtering the records counted (cls.ALLOWED_QRY_KWARGS)
+
+        Returns:
+            dict: column name mapped to a pandas Series of record counts
+                  indexed by the unique values
+        """
+        # A limit doesn't make sense when counting
+        kwargs.pop("limit", None)
+        column_names = cls._catalog_columns()
+        columns = [getattr(cls.MODEL, c) for c in column_names]
+        cache = cls.METADATA_CACHE
+        key = (cls._table_key(), "catalog", freeze_kwargs(kwargs))
+
+        with db_session(cls.DB_NAME) as (session, engine):
+            try:
+                results = None
+                if cache is not None:
+                    cache.validate(
+                        cls._table_key(),
+                        lambda: cls._table_fingerprint(session)
+                    )
+                    results = cache.get(key)
+
+                if results is None:
+                    # Group by each column on its own in a single scan, the
+                    # grouping flags tell which column a row belongs to
+                    qry = session.query(
+                        *columns,
+                        *[func.grouping(c) for c in columns],
+                        func.count().label("count")
+                    )
+                    qry = cls.extend_qry(qry, check_size=False, **kwargs)
+                    qry = qry.group_by(func.grouping_sets(*columns))
+                    results = qry.all()
+                    if cache is not None:
+                        cache.set(key, results)
+
+            except Exception as e:
+                session.close()
+                LOG.error("Failed query building the catalog")
+                raise e
+
+        n_columns = len(columns)
+        values = {c: {} for c in column_names}
+        for row in results:
+            for i, name in enumerate(column_names):
+                if row[n_columns + i] == 0:
+                    values[name][row[i]] = row[-1]
+
+        catalog = {}
+        for name in column_names:
+            counts = pd.Series(values[name], name="count", dtype="int64")
+            counts.index.name = name
+            catalog[name] = counts.sort_values(ascending=False)
+
+        return catalog
+
+    @classmethod
+    def _aggregate_function(cls, stat, column):
+        """
+        SQL expression computing a statistic of a column, see aggregate
+        """
+        if stat in AGGREGATES:
+            return AGGREGATES[stat](column)
+
+        if stat.startswith("p"):
+            try:
+                percent = float(stat[1:])
+            except ValueError:
+                percent = None
+            if percent is not None and 0 <= percent <= 100:
+                return func.percentile_cont(percent / 100).within_group(
+                    column
+                )
+
+        raise ValueError(
+            f"{stat} is not an allowed statistic, use one of"
+            f" {', '.join(AGGREGATES)} or a percentile like p50"
+        )
+
+    @classmethod
+    @instrumented
+    def aggregate(cls, by=None, stats=("count", "mean"), column="value",
+                  **kwargs):
+        """
+        Summarize the records in the database and return only the
+        statistics, one row per group
+
+        Args:
+            by: column name or list of column names to group by, e.g.
+                ["site_name", "date"]. None summarizes all the records.
+            stats: list of statistics, any of count, mean, std, min, max,
+                   sum or a percentile like p50 or p95
+            column: name of the numeric column to summarize
+            kwargs: for filtering the records (cls.ALLOWED_QRY_KWARGS), a
+                    limit applies to the number of groups
+        Returns: pandas DataFrame with the by columns and a column per
+                 statistic
+        """
+        if isinstance(by, str):
+            by = [by]
+        by = list(by or [])
+        stats = [stats] if isinstance(stats, str) else list(stats)
+        for name in by + [column]:
+            if not hasattr(cls.MODEL, name):
+                raise ValueError(f"{name} is not a column of {cls.MODEL}")
+
+        group_columns = [getattr(cls.MODEL, name) for name in by]
+        value = cls._range_column(column)
+        aggregates = [
+            cls._aggregate_function(stat, value).label(stat)
+            for stat in stats
+        ]
+        # The limit applies to the groups so it has to come last
+        filters = {k: v for k, v in kwargs.items() if k != "limit"}
+
+        with db_session(cls.DB_NAME) as (session, engine):
+            try:
+                qry = session.query(*group_columns, *aggregates)
+                qry = cls.extend_qry(qry, check_size=False, **filters)
+                if group_columns:
+                    qry = qry.group_by(*group_columns).order_by(
+                        *group_columns
+                    )
+                if "limit" in kwargs:
+                    qry = qry.limit(kwargs["limit"])
+                qry = cls._check_size(qry, kwargs, guard=True)
+                results = qry.all()
+                cls._check_result_size(results, kwargs)
+            except Exception as e:
+                session.close()
+                LOG.error("Failed aggregating the records")
+                raise e
+
+        return pd.DataFrame.from_records(results, columns=by + stats)
+
+    @classmethod
+    def _split_filters(cls, split_on=None, batch_size=1, date_step=None,
+                       **kwargs):
+        """
+        Split filters into the filters of smaller queries. A list is split
+        into batches of its values and a date range into windows of
+        date_step.
+
+        Args:
+            split_on: name of the list filter to split, defaults to the
+                      first list given
+            batch_size: number of list values in each query, dates are
+                        always split one at a time
+            date_step: datetime.timedelta for splitting date_greater_equal
+                       to date_less_equal into windows
+            kwargs: filters (cls.ALLOWED_QRY_KWARGS)
+
+        Returns:
+            list: dictionaries of filters
+        """
+        if date_step is not None:
+            start = kwargs.get("date_greater_equal")
+            end = kwargs.get("date_less_equal")
+            if start is None or end is None:
+                raise ValueError(
+                    "date_greater_equal and date_less_equal are needed to"
+                    " split by date_step"
+                )
+            filters = []
+            while start <= end:
+                window_end = min(start + date_step - timedelta(days=1), end)
+                filters.append(dict(
+                    kwargs, date_greater_equal=start,
+                    date_less_equal=window_end
+                ))
+                start = window_end + timedelta(days=1)
+            return filters
+
+        if split_on is None:
+            lists = [k for k, v in kwargs.items() if isinstance(v, list)]
+            if len(lists) == 0:
+                return [kwargs]
+            split_on = lists[0]
+
+        values = kwargs[split_on]
+        if not isinstance(values, list):
+            return [kwargs]
+
+        # The date filter doesn't accept lists
+        if split_on == "date":
+            batch_size = 1
+
+        filters = []
+        for i in range(0, len(values), batch_size):
+            batch = values[i:i + batch_size]
+            value = batch[0] if batch_size == 1 else batch
+            filters.append(dict(kwargs, **{split_on: value}))
+        return filters
+
+    @classmethod
+    def _fan_out(cls, method, filters, max_workers=None, ordered=True):
+        """
+        Run a method for each dictionary of filters concurrently on the
+        pooled engine and combine the results.
+
+        Args:
+            method: callable taking filters as kwargs, e.g. cls.from_filter
+            filters: list of dictionaries of filters
+            max_workers: number of concurrent queries, defaults to
+                         cls.PARALLEL_WORKERS
+            ordered: Boolean for combining results in the order of filters,
+                     otherwise in the order they finish
+
+        Returns:
+            results: combined dataframe or list of results
+        """
+        max_workers = min(max_workers or cls.PARALLEL_WORKERS, len(filters))
+        with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+            # Run each query in a copy of the caller's context so its
+            # statements are still tagged with the API call in query_stats
+            futures = [
+                executor.submit(copy_context().run, method, **f)
+                for f in filters
+            ]
+            if not ordered:
+                futures = as_completed(futures)
+            results = [f.result() for f in futures]
+
+        if len(results) == 0:
+            return gpd.GeoDataFrame()
+        if isinstance(results[0], pd.DataFrame):
+            return pd.concat(results, ignore_index=True)
+
+        # e.g. lists of rasters
+        return [r for result in results for r in result]
+
+    @classmethod
+    @instrumented
+    def from_filter_parallel(cls, split_on=None, batch_size=1, date_step=None,
+                             max_workers=None, ordered=True, **kwargs):
+        """
+        Split a from_filter request into smaller queries that run
+        concurrently and combine the results. Useful for long lists of
+        values or wide date ranges. Lists of dates are allowed here since
+        each date gets its own query. The max record count and any limit
+        apply to each of the smaller queries.
+
+        Args:
+            split_on: name of the list filter to split, defaults to the
+                      first list given
+            batch_size: number of list values in each query
+            date_step: datetime.timedelta for splitting date_greater_equal
+                       to date_less_equal into windows
+            max_workers: number of concurrent queries, defaults to
+                         cls.PARALLEL_WORKERS
+            ordered: Boolean for keeping the results in the order of the
+                     split values, otherwise in the order they finish
+            kwargs: for filtering (cls.ALLOWED_QRY_KWARGS)
+        Returns: combined results of from_filter
+        """
+        filters = cls._split_filters(
+            split_on=split_on, batch_size=batch_size, date_step=date_step,
+            **kwargs
+        )
+        return cls._fan_out(
+            cls.from_filter, filters, max_workers=max_workers,
+            ordered=ordered
+        )
+
     @property
     def all_site_names(self):
         """
         Return all types of the data
         """
-        with db_session(self.DB_NAME) as (session, engine):
-            qry = session.query(self.MODEL.site_name).distinct()
-            result = qry.all()
-        return self.retrieve_single_value_result(result)
+        return self.from_unique_entries(["site_name"])
 
     @property
     def all_types(self):
         """
         Return all types of the data
         """
-        with db_session(self.DB_NAME) as (session, engine):
-            qry = session.query(self.MODEL.type).distinct()
-            result = qry.all()
-        return self.retrieve_single_value_result(result)
+        return self.from_unique_entries(["type"])
 
     @property
     def all_dates(self):
         """
         Return all distinct dates in the data
         """
-        with db_session(self.DB_NAME) as (session, engine):
-            qry = session.query(self.MODEL.date).distinct()
-            result = qry.all()
-        return self.retrieve_single_value_result(result)
+        return self.from_unique_entries(["date"])
 
     @property
     def all_observers(self):
         """
         Return all distinct observers in the data
         """
-        with db_session(self.DB_NAME) as (session, engine):
-            qry = session.query(self.MODEL.observers).distinct()
-            result = qry.all()
-        return self.retrieve_single_value_result(result)
+        return self.from_unique_entries(["observers"])
 
     @property
     def all_units(self):
         """
         Return all distinct units in the data
         """
-        with db_session(self.DB_NAME) as (session, engine):
-            qry = session.query(self.MODEL.units).distinct()
-            result = qry.all()
-        return self.retrieve_single_value_result(result)
+        return self.from_unique_entries(["units"])
 
     @property
     def all_instruments(self):
         """
         Return all distinct instruments in the data
         """
-        with db_session(self.DB_NAME) as (session, engine):
-            qry = session.query(self.MODEL.instrument).distinct()
-            result = qry.all()
-        return self.retrieve_single_value_result(result)
+        return self.from_unique_entries(["instrument"])
 
 
 class PointMeasurements(BaseDataset):
@@ -230,16 +725,23 @@ class PointMeasurements(BaseDataset):
     MODEL = PointData
 
     @classmethod
+    @instrumented
     def from_filter(cls, **kwargs):
         """
         Get data for the class by filtering by allowed arguments. The allowed
         filters are cls.ALLOWED_QRY_KWARGS.
         """
         with db_session(cls.DB_NAME) as (session, engine):
-            try:
+            def fetch():
                 qry = session.query(cls.MODEL)
-                qry = cls.extend_qry(qry, **kwargs)
+                qry = cls.extend_qry(qry, check_size=False, **kwargs)
+                qry = cls._check_size(qry, kwargs, guard=True)
                 df = query_to_geopandas(qry, engine)
+                cls._check_result_size(df, kwargs)
+                return df
+
+            try:
+                df = cls._cached_result(session, fetch, "from_filter", kwargs)
             except Exception as e:
                 session.close()
                 LOG.error("Failed query for PointData")
@@ -248,7 +750,139 @@ class PointMeasurements(BaseDataset):
         return df
 
     @classmethod
-    def from_area(cls, shp=None, pt=None, buffer=None, crs=26912, **kwargs):
+    def iter_filter(cls, chunksize=10000, **kwargs):
+        """
+        Same as :py:meth:`from_filter` but streams the results from the
+        database in GeoDataFrames of at most chunksize records so memory use
+        doesn't grow with the size of the result. There is no max record
+        count when streaming.
+
+        Args:
+            chunksize: max number of records in each GeoDataFrame
+            kwargs: for more filtering or limiting (cls.ALLOWED_QRY_KWARGS)
+        Returns: Generator of Geopandas dataframes of results
+        """
+        with db_session(cls.DB_NAME) as (session, engine):
+            try:
+                qry = session.query(cls.MODEL)
+                qry = cls.extend_qry(qry, check_size=False, **kwargs)
+                yield from iter_query_to_geopandas(
+                    qry, engine, chunksize=chunksize
+                )
+            except Exception as e:
+                session.close()
+                LOG.error("Failed streaming query for PointData")
+                raise e
+
+    @classmethod
+    def _raster_srid(cls, session, raster_filter):
+        """
+        SRID of the rasters matching raster_filter, None when none match
+        """
+        raster = RasterMeasurements.MODEL.raster
+        qry = session.query(func.ST_SRID(raster))
+        qry = RasterMeasurements.extend_qry(
+            qry, check_size=False,
+            **{k: v for k, v in raster_filter.items() if k != "limit"}
+        )
+        return qry.limit(1).scalar()
+
+    @classmethod
+    def _sample_query(cls, session, srid, band, raster_filter):
+        """
+        Query of the raster value under a record, correlated to the
+        records. The records are transformed to the constant srid of the
+        raster so the tiles are found through the spatial index on the
+        raster instead of comparing every record with every tile.
+        """
+        raster = RasterMeasurements.MODEL.raster
+        if srid is None:
+            # No raster to sample
+            return session.query(null().cast(Float)).limit(1)
+
+        # Sample the first tile of the raster under each record
+        geom = func.ST_Transform(cls.MODEL.geom, int(srid))
+        sample = session.query(func.ST_Value(raster, band, geom, type_=Float))
+        sample = sample.filter(func.ST_Intersects(raster, geom))
+        sample = RasterMeasurements.extend_qry(
+            sample, check_size=False, **raster_filter
+        )
+        return sample.correlate(cls.MODEL).limit(1)
+
+    @classmethod
+    @instrumented
+    def sample_raster(cls, raster_filter=None, band=1,
+                      value_column="raster_value", **kwargs):
+        """
+        Get data for the class with the value of a raster at each location
+        attached. The sampling is done in the database in one query, each
+        record looks up the raster tile it falls in through the spatial
+        index and reads the pixel with ST_Value. The rasters matching
+        raster_filter are expected to share a crs.
+
+        Args:
+            raster_filter: dictionary of filters for the raster, see
+                           RasterMeasurements.ALLOWED_QRY_KWARGS
+            band: raster band to sample
+            value_column: name of the column holding the sampled values
+            kwargs: for filtering or limiting the records
+                    (cls.ALLOWED_QRY_KWARGS)
+        Returns: Geopandas dataframe of results, records outside of the
+                 raster have a null value
+        """
+        raster_filter = raster_filter or {}
+
+        with db_session(cls.DB_NAME) as (session, engine):
+            try:
+                sample = cls._sample_query(
+                    session, cls._raster_srid(session, raster_filter), band,
+                    raster_filter
+                )
+                qry = session.query(
+                    cls.MODEL, sample.scalar_subquery().label(value_column)
+                )
+                qry = cls.extend_qry(qry, check_size=False, **kwargs)
+                qry = cls._check_size(qry, kwargs, guard=True)
+                df = query_to_geopandas(qry, engine)
+                cls._check_result_size(df, kwargs)
+            except Exception as e:
+                session.close()
+                LOG.error("Failed sampling raster data")
+                raise e
+
+        return df
+
+    @classmethod
+    def _filter_area(cls, qry, shp=None, pt=None, buffer=None, crs=26912,
+                     geography=False):
+        """
+        Filter a query to the records within a shape or within a distance
+        of a point. The distance is checked with ST_DWithin, which uses the
+        spatial index and is exact unlike a polygon of the buffer.
+        """
+        if shp is not None:
+            area = from_shape(shp, srid=int(crs))
+            return qry.filter(func.ST_Within(cls.MODEL.geom, area))
+
+        center = from_shape(pt, srid=int(crs))
+        if geography:
+            # Meters on the spheroid, for records in more than one crs. The
+            # expression and the srid check match the partial geography
+            # index on the table so the planner can use it.
+            return qry.filter(
+                func.ST_SRID(cls.MODEL.geom) != 0,
+                func.ST_DWithin(
+                    func.geography(func.ST_Transform(cls.MODEL.geom, 4326)),
+                    func.geography(func.ST_Transform(center, 4326)),
+                    buffer
+                )
+            )
+        return qry.filter(func.ST_DWithin(cls.MODEL.geom, center, buffer))
+
+    @classmethod
+    @instrumented
+    def from_area(cls, shp=None, pt=None, buffer=None, crs=26912,
+                  geography=False, **kwargs):
         """
         Get data for the class within a specific shapefile or
         within a point and a known buffer
@@ -258,47 +892,355 @@ class PointMeasurements(BaseDataset):
                 to find search area
             buffer: in same units as point
             crs: integer crs to use
+            geography: measure the buffer in meters on the spheroid so
+                       records in any crs are found, e.g. across UTM
+                       zones. Records without a srid are skipped.
             kwargs: for more filtering or limiting (cls.ALLOWED_QRY_KWARGS)
         Returns: Geopandas dataframe of results
 
         """
-        if shp is None and pt is None:
-            raise ValueError(
-                "Inputs must be a shape description or a point and buffer"
-            )
-        if (pt is not None and buffer is None) or \
-                (buffer is not None and pt is None):
-            raise ValueError("pt and buffer must be given together")
+        cls._check_area_args(shp=shp, pt=pt, buffer=buffer)
         with db_session(cls.DB_NAME) as (session, engine):
+            def fetch():
+                qry = session.query(cls.MODEL)
+                qry = cls._filter_area(
+                    qry, shp=shp, pt=pt, buffer=buffer, crs=crs,
+                    geography=geography
+                )
+                qry = cls.extend_qry(qry, check_size=False, **kwargs)
+                qry = cls._check_size(qry, kwargs, guard=True)
+                df = query_to_geopandas(qry, engine)
+                cls._check_result_size(df, kwargs)
+                return df
+
             try:
-                if shp is not None:
-                    qry = session.query(cls.MODEL)
-                    qry = qry.filter(
-                        func.ST_Within(
-                            cls.MODEL.geom, from_shape(shp, srid=crs)
-                        )
+                df = cls._cached_result(
+                    session, fetch, "from_area",
+                    dict(kwargs, buffer=buffer, crs=crs, geography=geography),
+                    [shp, pt]
+                )
+            except Exception as e:
+                session.close()
+                raise e
+
+        return df
+
+    @classmethod
+    @instrumented
+    def from_areas(cls, areas, id_col=None, crs=26912, **kwargs):
+        """
+        Get data for the class within each of many shapes in a single
+        spatial join instead of a from_area query per shape. Records
+        within more than one shape are returned once for each.
+
+        Args:
+            areas: GeoDataFrame, GeoSeries or list of shapely geometries
+            id_col: column of areas labeling the results, defaults to the
+                    index of areas
+            crs: integer crs of the shapes, a GeoSeries or GeoDataFrame
+                 with a crs is transformed to it
+            kwargs: for more filtering or limiting (cls.ALLOWED_QRY_KWARGS)
+        Returns: Geopandas dataframe of results with the label of their
+                 shape in an id_col column, area_id when id_col is None
+        """
+        shapes = cls._to_geoseries(areas, crs)
+        if id_col is None:
+            labels = shapes.index
+        elif isinstance(areas, gpd.GeoDataFrame) and id_col in areas:
+            labels = pd.Index(areas[id_col])
+        else:
+            raise ValueError(f"{id_col} is not a column of areas")
+
+        with db_session(cls.DB_NAME) as (session, engine):
+            try:
+                # Ship the shapes as a VALUES list and join the records
+                # within them through the spatial index
+                area_values = cls._geometry_values(shapes.values, "areas")
+                area = func.ST_GeomFromWKB(area_values.c.wkb, int(crs))
+                qry = session.query(
+                    area_values.c.idx.label("area_id"), cls.MODEL
+                ).select_from(area_values).join(
+                    cls.MODEL, func.ST_Within(cls.MODEL.geom, area)
+                )
+                qry = cls.extend_qry(qry, check_size=False, **kwargs)
+                qry = cls._check_size(qry, kwargs, guard=True)
+                df = query_to_geopandas(qry, engine)
+                cls._check_result_size(df, kwargs)
+            except Exception as e:
+                session.close()
+                LOG.error("Failed query for many areas")
+                raise e
+
+        df = cls._label_positions(df, "area_id", labels)
+        if id_col is not None:
+            df = df.rename(columns={"area_id": id_col})
+        return df
+
+    @classmethod
+    def iter_area(cls, shp=None, pt=None, buffer=None, crs=26912,
+                  geography=False, chunksize=10000, **kwargs):
+        """
+        Same as :py:meth:`from_area` but streams the results from the
+        database in GeoDataFrames of at most chunksize records.
+
+        Args:
+            shp: shapely geometry in which to filter
+            pt: shapely point that will have a buffer applied in order
+                to find search area
+            buffer: in same units as point
+            crs: integer crs to use
+            geography: measure the buffer in meters on the spheroid, see
+                       :py:meth:`from_area`
+            chunksize: max number of records in each GeoDataFrame
+            kwargs: for more filtering or limiting (cls.ALLOWED_QRY_KWARGS)
+        Returns: Generator of Geopandas dataframes of results
+        """
+        cls._check_area_args(shp=shp, pt=pt, buffer=buffer)
+        with db_session(cls.DB_NAME) as (session, engine):
+            try:
+                qry = session.query(cls.MODEL)
+                qry = cls._filter_area(
+                    qry, shp=shp, pt=pt, buffer=buffer, crs=crs,
+                    geography=geography
+                )
+                qry = cls.extend_qry(qry, check_size=False, **kwargs)
+                yield from iter_query_to_geopandas(
+                    qry, engine, chunksize=chunksize
+                )
+            except Exception as e:
+                session.close()
+                raise e
+
+    @staticmethod
+    def _geometry_values(geometries, name):
+        """
+        VALUES list of shapely geometries as WKB with their position, for
+        joining many shapes in a single query
+        """
+        return values(
+            sql_column("idx", Integer), sql_column("wkb", LargeBinary),
+            name=name
+        ).data([
+            (i, shapely.to_wkb(g)) for i, g in enumerate(geometries)
+        ])
+
+    @staticmethod
+    def _to_geoseries(geometries, crs):
+        """
+        GeoSeries of a list, GeoSeries or GeoDataFrame of geometries in crs
+        """
+        if isinstance(geometries, gpd.GeoDataFrame):
+            geometries = geometries.geometry
+        geometries = gpd.GeoSeries(geometries)
+        if geometries.crs is not None:
+            geometries = geometries.to_crs(crs)
+        return geometries
+
+    @staticmethod
+    def _label_positions(df, column, labels):
+        """
+        Replace the positions in a column of query results with the
+        labels at those positions. An empty result is returned as is since
+        its column has no integer dtype to index with.
+        """
+        if df.empty:
+            return df
+        df[column] = labels.take(df[column].astype(int))
+        return df
+
+    @classmethod
+    def _nearest_query(cls, session, center, k, **kwargs):
+        """
+        Query of the k records closest to a point expression. Ordering by
+        the <-> operator with a limit walks the spatial index instead of
+        sorting every record.
+        """
+        if "limit" in kwargs:
+            raise ValueError("Use k to limit the number of records")
+        qry = session.query(
+            cls.MODEL,
+            func.ST_Distance(cls.MODEL.geom, center).label("distance")
+        )
+        qry = cls.extend_qry(qry, check_size=False, **kwargs)
+        return qry.order_by(cls.MODEL.geom.distance_centroid(center)).limit(k)
+
+    @classmethod
+    @instrumented
+    def nearest(cls, pt, k=1, crs=26912, **kwargs):
+        """
+        Get the k records closest to a point, or to each of many points in
+        a single query. There is no max record count, at most k records
+        per point are returned.
+
+        Args:
+            pt: shapely point, or a list, GeoSeries or GeoDataFrame of
+                points to search around each one
+            k: number of records to return per point
+            crs: integer crs of the points, a GeoSeries or GeoDataFrame
+                 with a crs is transformed to it
+            kwargs: for more filtering (cls.ALLOWED_QRY_KWARGS)
+        Returns: Geopandas dataframe of results ordered by their distance
+                 to the point in a distance column. When searching around
+                 many points a query_id column holds the index of the
+                 point each record belongs to.
+        """
+        single = isinstance(pt, Point)
+        if not single:
+            points = cls._to_geoseries(pt, crs)
+
+        with db_session(cls.DB_NAME) as (session, engine):
+            try:
+                if single:
+                    qry = cls._nearest_query(
+                        session, from_shape(pt, srid=int(crs)), k, **kwargs
                     )
-                    qry = cls.extend_qry(qry, check_size=True, **kwargs)
                     df = query_to_geopandas(qry, engine)
                 else:
-                    qry_pt = from_shape(pt)
+                    # Ship the points as a VALUES list and search around
+                    # each one in a LATERAL subquery
+                    query_points = cls._geometry_values(
+                        points.values, "query_points"
+                    )
+                    center = func.ST_GeomFromWKB(query_points.c.wkb, int(crs))
+                    nearest = cls._nearest_query(
+                        session, center, k, **kwargs
+                    ).subquery().lateral("nearest")
                     qry = session.query(
-                        gfunc.ST_SetSRID(
-                            func.ST_Buffer(qry_pt, buffer), crs
-                        )
+                        query_points.c.idx.label("query_id"), nearest
+                    ).select_from(query_points).join(nearest, true())
+                    qry = qry.order_by(
+                        query_points.c.idx, nearest.c.distance
                     )
-
-                    buffered_pt = qry.all()[0][0]
-                    qry = session.query(cls.MODEL)
-                    qry = qry.filter(func.ST_Within(cls.MODEL.geom, buffered_pt))
-                    qry = cls.extend_qry(qry, check_size=True, **kwargs)
                     df = query_to_geopandas(qry, engine)
+                    # Label the results with the index of their point
+                    df = cls._label_positions(df, "query_id", points.index)
             except Exception as e:
                 session.close()
+                LOG.error("Failed nearest neighbor query")
                 raise e
 
         return df
 
+    @classmethod
+    def _grid_bounds(cls, session, cell_size, **kwargs):
+        """
+        Bounds of a grid of cell_size covering the filtered records, the max
+        edges are pushed out a cell so records on them land in the grid
+        """
+        x = func.ST_X(cls.MODEL.geom)
+        y = func.ST_Y(cls.MODEL.geom)
+        qry = session.query(
+            func.min(x), func.min(y), func.max(x), func.max(y)
+        )
+        qry = cls.extend_qry(qry, check_size=False, **kwargs)
+        xmin, ymin, xmax, ymax = qry.one()
+        if xmin is None:
+            raise ValueError("No records found to grid")
+
+        cols = math.floor((xmax - xmin) / cell_size) + 1
+        rows = math.floor((ymax - ymin) / cell_size) + 1
+        return xmin, ymax - rows * cell_size, xmin + cols * cell_size, ymax
+
+    @classmethod
+    @instrumented
+    def grid(cls, cell_size, bounds=None, crs=26912,
+             stats=("count", "mean"), column="value", as_rasterio=False,
+             **kwargs):
+        """
+        Bin the records onto a regular grid in the database and return
+        only the statistics of each cell, so the data moved grows with the
+        number of cells instead of the number of records
+
+        Args:
+            cell_size: width and height of the cells in the units of crs
+            bounds: (xmin, ymin, xmax, ymax) of the grid, defaults to the
+                    extent of the filtered records
+            crs: integer crs of the records and the bounds
+            stats: list of statistics, see :py:meth:`aggregate`
+            column: name of the numeric column to summarize
+            as_rasterio: return an in memory rasterio dataset instead of
+                         a numpy array
+            kwargs: for filtering the records (cls.ALLOWED_QRY_KWARGS)
+        Returns: tuple of a numpy array of shape (stats, rows, cols), its
+                 affine transform and crs, or a rasterio dataset with a
+                 band per statistic. Empty cells have a count of 0 and
+                 are nan for the other statistics.
+        """
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive")
+        cell_size = float(cell_size)
+        if "limit" in kwargs:
+            raise ValueError("limit is not supported when gridding")
+        stats = [stats] if isinstance(stats, str) else list(stats)
+        if not hasattr(cls.MODEL, column):
+            raise ValueError(f"{column} is not a column of {cls.MODEL}")
+
+        value = cls._range_column(column)
+        # Fail on unknown statistics before connecting
+        for stat in stats:
+            cls._aggregate_function(stat, value)
+
+        with db_session(cls.DB_NAME) as (session, engine):
+            try:
+                if bounds is None:
+                    bounds = cls._grid_bounds(session, cell_size, **kwargs)
+                xmin, ymin, xmax, ymax = [float(b) for b in bounds]
+                n_cols = math.ceil((xmax - xmin) / cell_size)
+                n_rows = math.ceil((ymax - ymin) / cell_size)
+
+                # Cell indices of each record counted from the top left
+                cells = session.query(
+                    func.floor(
+                        (ymax - func.ST_Y(cls.MODEL.geom)) / cell_size
+                    ).label("row"),
+                    func.floor(
+                        (func.ST_X(cls.MODEL.geom) - xmin) / cell_size
+                    ).label("col"),
+                    value.label("value"),
+                ).filter(func.ST_Intersects(
+                    cls.MODEL.geom,
+                    func.ST_MakeEnvelope(xmin, ymin, xmax, ymax, crs)
+                ))
+                cells = cls.extend_qry(
+                    cells, check_size=False, **kwargs
+                ).subquery()
+
+                # Group the subquery so the cell expressions are only
+                # written once
+                qry = session.query(cells.c.row, cells.c.col, *[
+                    cls._aggregate_function(stat, cells.c.value)
+                    for stat in stats
+                ]).group_by(cells.c.row, cells.c.col)
+                with query_stats.phase("grid") as info:
+                    results = qry.all()
+                    info["rows"] = len(results)
+            except Exception as e:
+                session.close()
+                LOG.error("Failed gridding the records")
+                raise e
+
+        arr = np.full((len(stats), n_rows, n_cols), np.nan)
+        for i, stat in enumerate(stats):
+            if stat == "count":
+                arr[i] = 0
+        if results:
+            values = np.array(results, dtype=float)
+            rows = values[:, 0].astype(int)
+            cols = values[:, 1].astype(int)
+            # Records on the max edges of the bounds fall outside the grid
+            inside = (rows >= 0) & (rows < n_rows) & \
+                (cols >= 0) & (cols < n_cols)
+            arr[:, rows[inside], cols[inside]] = values[inside, 2:].T
+
+        transform = from_origin(xmin, ymax, cell_size, cell_size)
+        if as_rasterio:
+            return array_to_rasterio(
+                arr, transform, CRS.from_epsg(int(crs)), nodata=np.nan,
+                descriptions=stats
+            )
+        return arr, transform, CRS.from_epsg(int(crs))
+
+
 class TooManyRastersException(Exception):
     """ Exceptiont to report to users that their query will produce too many rasters"""
     pass
@@ -310,78 +1252,476 @@ class LayerMeasurements(PointMeasurements):
     MODEL = LayerData
     ALLOWED_QRY_KWARGS = [
         "site_name", "site_id", "date", "instrument", "observers", "type",
-        "utm_zone", "pit_id", "date_greater_equal", "date_less_equal"
+        "utm_zone", "pit_id", "date_greater_equal", "date_less_equal",
+        "value_greater_equal", "value_less_equal"
     ]
     # TODO: layer analysis methods?
 
+    @classmethod
+    def _range_column(cls, key):
+        # Values are stored as text, compare their numeric copy instead
+        if key == "value":
+            return cls.MODEL.value_num
+        return super()._range_column(key)
+
     @property
     def all_site_ids(self):
         """
         Return all types of the data
         """
-        with db_session(self.DB_NAME) as (session, engine):
-            qry = session.query(self.MODEL.site_id).distinct()
-            result = qry.all()
-        return self.retrieve_single_value_result(result)
+        return self.from_unique_entries(["site_id"])
 
 class RasterMeasurements(BaseDataset):
     MODEL = ImageData
     ALLOWED_QRY_KWARGS = BaseDataset.ALLOWED_QRY_KWARGS + ['description']
+    # Where tiles are mosaicked, 'server' uses ST_Union in the database and
+    # 'client' fetches the tiles in parallel and merges them locally
+    MOSAIC = "server"
+    # Number of parallel tile requests for the client mosaic
+    MOSAIC_WORKERS = 4
+    # Columns that differ between raster datasets
+    DATASET_COLUMNS = [
+        'instrument', 'date', 'observers', 'doi', 'type', 'description'
+    ]
 
     @property
     def all_descriptions(self):
-        with db_session(self.DB_NAME) as (session, engine):
-            qry = session.query(self.MODEL.description).distinct()
-            result = qry.all()
-        return self.retrieve_single_value_result(result)
+        return self.from_unique_entries(["description"])
 
     @classmethod
-    def check_for_single_dataset(cls, **kwargs):
+    def _filter_source(cls, qry, source, **kwargs):
         """
-        At the moment there is not a clear path to how to deal with multiple rasters so
-        check that the user only requested one dataset
+        Filter a query of a table or view other than cls.MODEL that holds
+        some of the filter columns, like extend_qry
+
+        Args:
+            qry: query of source
+            source: mapped class or column collection of a table
+            kwargs: filters (cls.ALLOWED_QRY_KWARGS), limit is ignored
+        Returns:
+            qry: the filtered query, None if a filter isn't a column of
+                 source, e.g. site_name for the raster catalog
+        """
+        for k, v in kwargs.items():
+            if k == "limit":
+                continue
+            key = k.replace("_greater_equal", "").replace("_less_equal", "")
+            if k not in cls.ALLOWED_QRY_KWARGS or not hasattr(source, key):
+                return None
+            column = getattr(source, key)
+            if k.endswith("_greater_equal"):
+                qry = qry.filter(column >= v)
+            elif k.endswith("_less_equal"):
+                qry = qry.filter(column <= v)
+            elif isinstance(v, list):
+                qry = qry.filter(column.in_(v))
+            else:
+                qry = qry.filter(column == v)
+        return qry
+
+    @classmethod
+    def _catalog_query(cls, qry, **kwargs):
+        """
+        Filter a query of the raster catalog like extend_qry
+
+        Returns:
+            qry: the filtered query, None if a filter isn't a column of the
+                 catalog, e.g. site_name
+        """
+        return cls._filter_source(qry, RasterCatalog, **kwargs)
+
+    @classmethod
+    def _current_catalog_query(cls, qry, **kwargs):
+        """
+        Filter a query of the raster catalog like _catalog_query but only
+        return rows while the catalog matches the images table. It's a
+        snapshot, so rasters uploaded, updated or deleted since it was last
+        refreshed aren't reflected in it.
+        """
+        qry = cls._catalog_query(qry, **kwargs)
+        if qry is None:
+            return None
+
+        def scalar(*columns):
+            # Not correlated with the catalog rows of the outer query
+            return select(*columns).correlate(None).scalar_subquery()
+
+        updated = func.coalesce(ImageData.time_updated, ImageData.time_created)
+        return qry.filter(and_(
+            scalar(func.sum(RasterCatalog.tiles))
+            == scalar(func.count(ImageData.id)),
+            scalar(func.max(RasterCatalog.last_updated))
+            == scalar(func.max(updated)),
+        ))
+
+    @classmethod
+    def _check_dataset_values(cls, column, values):
+        if len(values) > 1:
+            options = [f"'{v}'" for v in values]
+            raise TooManyRastersException(
+                f"More than one `{column}` suggests there are multiple"
+                f" raster datasets. Try filter {column} to one of the"
+                f" following values {', '.join(options)}."
+            )
+
+    @classmethod
+    def _check_catalog_rows(cls, rows):
+        """
+        Check rows of the dataset columns from the raster catalog
+        """
+        for i, column in enumerate(cls.DATASET_COLUMNS):
+            values = list(dict.fromkeys(
+                row[i] for row in rows if row[i] is not None
+            ))
+            cls._check_dataset_values(column, values)
+
+    @classmethod
+    @instrumented
+    def datasets(cls, **kwargs):
+        """
+        Get the raster datasets from the raster catalog, one row per
+        dataset with its tile count, footprint, pixel size, crs and nodata.
+        See snowexsql.db.create_raster_catalog.
+
+        Args:
+            kwargs: for filtering the datasets, any of cls.ALLOWED_QRY_KWARGS
+                    that are columns of the catalog
+        Returns: Geopandas dataframe of the datasets
         """
-        LOG.info("Checking raster query for single raster dataset...")
-        multi_raster_indicators = ['instrument', 'date', 'observers', 'doi', 'type', 'description']
         with db_session(cls.DB_NAME) as (session, engine):
             try:
-                # Form query and check if the query spans multipl rasters
-                for column in multi_raster_indicators:
-                    values = cls.from_unique_entries([column], **kwargs)
-                    if len(values) > 1:
-                        options = [f"'{v}'" for v in values]
-                        raise TooManyRastersException(f"More than one `{column}` suggests there are multiple raster datasets. "
-                                                      f"Try filter {column} to one of the following values {', '.join(options)}.")
-
+                qry = cls._catalog_query(
+                    session.query(RasterCatalog), **kwargs
+                )
+                if qry is None:
+                    raise ValueError(
+                        f"Datasets can only be filtered by"
+                        f" {', '.join(cls.DATASET_COLUMNS)} or units"
+                    )
+                if "limit" in kwargs:
+                    qry = qry.limit(kwargs["limit"])
+                df = query_to_geopandas(qry, engine, geom_col="footprint")
             except Exception as e:
                 session.close()
-                LOG.error("Failed query for Raster Data")
+                LOG.error("Failed query for the raster catalog")
                 raise e
 
+        return df
+
     @classmethod
-    def from_filter(cls, **kwargs):
+    def check_for_single_dataset(cls, **kwargs):
+        """
+        At the moment there is not a clear path to how to deal with multiple rasters so
+        check that the user only requested one dataset. This is a single
+        lookup in the raster catalog when it exists and is up to date with
+        the images table, otherwise each of the dataset columns is checked
+        in the images table.
+        """
+        LOG.info("Checking raster query for single raster dataset...")
+        with db_session(cls.DB_NAME) as (session, engine):
+            qry = cls._current_catalog_query(session.query(*[
+                getattr(RasterCatalog, c) for c in cls.DATASET_COLUMNS
+            ]), **kwargs)
+            rows = None
+            if qry is not None:
+                try:
+                    rows = qry.all()
+                except ProgrammingError:
+                    # The catalog hasn't been created in this database
+                    session.rollback()
+
+        # Nothing matched or the catalog is stale
+        if rows:
+            cls._check_catalog_rows(rows)
+            return
+
+        try:
+            # Form query and check if the query spans multipl rasters
+            for column in cls.DATASET_COLUMNS:
+                values = cls.from_unique_entries([column], **kwargs)
+                cls._check_dataset_values(column, values)
+
+        except Exception as e:
+            LOG.error("Failed query for Raster Data")
+            raise e
+
+    @classmethod
+    def _check_rescale_args(cls, resolution=None, scale_factor=None):
+        if resolution is not None and scale_factor is not None:
+            raise ValueError(
+                "Only one of resolution or scale_factor can be given"
+            )
+
+    @staticmethod
+    def _rescale(raster, resolution=None, scale_factor=None,
+                 resample="NearestNeighbor"):
+        """
+        Rescale a raster on the server to a pixel size or by a factor of its
+        current pixel size. Returns the raster untouched without either.
+        """
+        if resolution is not None:
+            resolution = float(resolution)
+            return func.ST_Rescale(
+                raster, resolution, resolution, resample, type_=Raster
+            )
+        elif scale_factor is not None:
+            scale_factor = float(scale_factor)
+            return func.ST_Rescale(
+                raster,
+                func.abs(func.ST_ScaleX(raster)) * scale_factor,
+                func.abs(func.ST_ScaleY(raster)) * scale_factor,
+                resample, type_=Raster
+            )
+        return raster
+
+    @classmethod
+    def _find_overview(cls, session, scale_factor, kwargs):
+        """
+        Look for the coarsest overview registered for the raster column that
+        is no coarser than scale_factor and holds the filter columns. The
+        overviews made by raster2pgsql -l or ST_CreateOverview only have an
+        id and the raster, which can't tell datasets apart, so they're only
+        used without filters. Overview tables made with the dataset columns,
+        e.g. one per dataset, work with them too.
+
+        Returns:
+            tuple: **columns** - column collection of the overview table,
+                   **raster** - raster column of the overview,
+                   **factor** - overview factor
+                   or None when there is no usable overview
+        """
+        qry = text(
+            "SELECT o_table_schema, o_table_name, o_raster_column,"
+            " overview_factor FROM raster_overviews"
+            " WHERE r_table_schema = :schema AND r_table_name = :table"
+            " AND r_raster_column = :column AND overview_factor <= :factor"
+            " ORDER BY overview_factor DESC"
+        )
+        table = cls.MODEL.__table__
+        rows = session.execute(qry, dict(
+            schema=table.schema, table=table.name, column="raster",
+            factor=scale_factor
+        )).all()
+
+        for schema, name, raster_column, factor in rows:
+            overview = Table(
+                name, MetaData(), schema=schema,
+                autoload_with=session.connection()
+            )
+            if cls._filter_source(Query([]), overview.c, **kwargs) is not None:
+                LOG.info(f"Using raster overview {name} at factor {factor}")
+                return overview.c, overview.c[raster_column], factor
+
+        return None
+
+    @classmethod
+    def _server_mosaic_query(cls, session, db_shp=None, check_size=True,
+                             resolution=None, scale_factor=None,
+                             resample="NearestNeighbor", **kwargs):
+        """
+        Build the query to union the tiles in the database, clipping to a
+        shape and rescaling when requested before encoding them as a tiff.
+        Overviews are only looked up when a session is given.
+
+        Returns:
+            qry: query returning the tiff
+        """
+        if check_size:
+            # The union is a single row, so count the tiles it's made from
+            cls.extend_qry(Query([cls.MODEL.id], session), **kwargs)
+
+        overview = None
+        if scale_factor is not None and session is not None:
+            overview = cls._find_overview(session, scale_factor, kwargs)
+
+        raster = cls.MODEL.raster
+        if overview is not None:
+            source, raster, factor = overview
+            scale_factor = scale_factor / factor
+            if scale_factor == 1:
+                scale_factor = None
+
+        base_query = func.ST_Union(raster, type_=Raster)
+        if db_shp is not None:
+            base_query = func.ST_Clip(base_query, db_shp, True)
+
+        if resolution is None and scale_factor is None:
+            qry = Query([func.ST_AsTiff(base_query)], session)
+        else:
+            qry = Query([base_query.label("raster")], session)
+
+        if db_shp is not None:
+            # Find all the tiles that
+            qry = qry.filter(gfunc.ST_Intersects(raster, db_shp))
+        if overview is None:
+            qry = cls.extend_qry(qry, check_size=False, **kwargs)
+        else:
+            qry = cls._filter_source(qry, source, **kwargs)
+
+        if resolution is not None or scale_factor is not None:
+            # Rescale the mosaic once it's formed so the tiles stay aligned
+            mosaic = qry.subquery()
+            qry = Query([func.ST_AsTiff(cls._rescale(
+                mosaic.c.raster, resolution=resolution,
+                scale_factor=scale_factor, resample=resample
+            ))], session)
+
+        return qry
+
+    @classmethod
+    def _tile_raster(cls, db_shp=None, grid=None, resample="NearestNeighbor"):
+        """
+        Raster of a tile clipped to a shape and resampled onto a grid when
+        requested
+
+        Args:
+            db_shp: optional shape to clip the tiles to
+            grid: optional (x, y, scale_x, scale_y) of a pixel corner and
+                  the pixel size shared by all the tiles
+            resample: postgis resampling algorithm
+        """
+        raster = cls.MODEL.raster
+        if db_shp is not None:
+            raster = func.ST_Clip(raster, db_shp, True)
+        if grid is not None:
+            x, y, scale_x, scale_y = grid
+            raster = func.ST_Resample(
+                raster, scale_x, -scale_y, x, y, 0, 0, resample, type_=Raster
+            )
+        return raster
+
+    @classmethod
+    def _fetch_tiles(cls, tile_ids, db_shp=None, grid=None,
+                     resample="NearestNeighbor"):
+        """
+        Retrieve tiles by id as rasterio datasets, see _tile_raster. Uses
+        its own session so it can run in a thread.
+        """
+        raster = cls._tile_raster(db_shp=db_shp, grid=grid, resample=resample)
+
+        with db_session(cls.DB_NAME) as (session, engine):
+            qry = session.query(func.ST_AsTiff(raster))
+            qry = qry.filter(cls.MODEL.id.in_(tile_ids))
+            rasters = qry.order_by(cls.MODEL.id).all()
+
+        return raster_to_rasterio(rasters)
+
+    @classmethod
+    def _tile_grid(cls, session, tile_id, resolution=None, scale_factor=None):
+        """
+        Grid to resample tiles onto so they stay aligned with each other,
+        anchored at the corner of one tile
+
+        Returns:
+            tuple: (x, y, scale_x, scale_y) or None without a rescale
+        """
+        if resolution is None and scale_factor is None:
+            return None
+
+        raster = cls.MODEL.raster
+        x, y, scale_x, scale_y = session.query(
+            func.ST_UpperLeftX(raster), func.ST_UpperLeftY(raster),
+            func.abs(func.ST_ScaleX(raster)), func.abs(func.ST_ScaleY(raster))
+        ).filter(cls.MODEL.id == tile_id).one()
+        if resolution is not None:
+            scale_x = scale_y = float(resolution)
+        else:
+            scale_x *= float(scale_factor)
+            scale_y *= float(scale_factor)
+        return x, y, scale_x, scale_y
+
+    @classmethod
+    def _mosaic_tiles(cls, qry, db_shp=None, max_workers=None,
+                      resolution=None, scale_factor=None,
+                      resample="NearestNeighbor"):
+        """
+        Fetch the tiles selected by a query of tile ids in parallel over
+        pooled connections and mosaic them on the client instead of with
+        ST_Union on the server. A rescale resamples every tile onto the
+        same grid so the tiles line up when merged.
+
+        Returns:
+            dataset: rasterio dataset of the mosaic, None if no tiles match
+        """
+        tile_ids = [int(r[0]) for r in qry.order_by(cls.MODEL.id).all()]
+        if len(tile_ids) == 0:
+            return None
+
+        grid = cls._tile_grid(
+            qry.session, tile_ids[0], resolution=resolution,
+            scale_factor=scale_factor
+        )
+        max_workers = max_workers or cls.MOSAIC_WORKERS
+        n_batches = min(max_workers, len(tile_ids))
+        batches = [tile_ids[i::n_batches] for i in range(n_batches)]
+
+        with ThreadPoolExecutor(max_workers=n_batches) as executor:
+            # Keep the query_stats call tagging in the threads, see _fan_out
+            futures = [
+                executor.submit(
+                    copy_context().run, cls._fetch_tiles, ids,
+                    db_shp=db_shp, grid=grid, resample=resample
+                )
+                for ids in batches
+            ]
+            datasets = [d for f in futures for d in f.result()]
+
+        if len(datasets) == 0:
+            return None
+        return merge_rasterio(datasets)
+
+    @classmethod
+    @instrumented
+    def from_filter(cls, mosaic=None, max_workers=None, resolution=None,
+                    scale_factor=None, resample="NearestNeighbor", **kwargs):
         """
         Get data for the class by filtering by allowed arguments. The allowed
         filters are cls.ALLOWED_QRY_KWARGS.
-        """
 
+        Args:
+            mosaic: 'server' to union the tiles in the database or 'client'
+                    to fetch them in parallel and mosaic them locally.
+                    Defaults to cls.MOSAIC
+            max_workers: number of parallel tile requests for the client
+                         mosaic, defaults to cls.MOSAIC_WORKERS
+            resolution: pixel size to rescale to on the server before the
+                        raster is sent, in the units of the raster crs
+            scale_factor: factor to multiply the pixel size by on the server,
+                          e.g. 10 for a preview with a tenth of the rows and
+                          columns. Uses a raster overview with the filter
+                          columns when one exists
+            resample: postgis resampling algorithm used for rescaling
+            kwargs: for filtering (cls.ALLOWED_QRY_KWARGS)
+        Returns: list of rasterio datasets
+        """
+        cls._check_rescale_args(resolution, scale_factor)
         cls.check_for_single_dataset(**kwargs)
+        mosaic = mosaic or cls.MOSAIC
 
         with db_session(cls.DB_NAME) as (session, engine):
             try:
-                # Rebuild the query and form the raster
-                base_query = cls.MODEL.raster
+                if mosaic == "client":
+                    kwargs.pop("limit", None)
+                    qry = session.query(cls.MODEL.id)
+                    qry = cls.extend_qry(qry, check_size=False, **kwargs)
+                    dataset = cls._mosaic_tiles(
+                        qry, max_workers=max_workers, resolution=resolution,
+                        scale_factor=scale_factor, resample=resample
+                    )
+                    datasets = [] if dataset is None else [dataset]
 
-                qry = session.query(
-                    func.ST_AsTiff(
-                        func.ST_Union(base_query, type_=Raster)
+                elif mosaic == "server":
+                    qry = cls._server_mosaic_query(
+                        session, resolution=resolution,
+                        scale_factor=scale_factor, resample=resample,
+                        **kwargs
                     )
-                )
-                qry = cls.extend_qry(qry, **kwargs)
-                rasters = qry.all()
+                    rasters = qry.all()
 
-                # Get the rasterio object of the raster
-                datasets = raster_to_rasterio(rasters)
+                    # Get the rasterio object of the raster
+                    datasets = raster_to_rasterio(rasters)
+                else:
+                    raise ValueError(f"{mosaic} is not an allowed mosaic")
 
             except Exception as e:
                 LOG.error("Failed query for Raster Data")
@@ -390,41 +1730,73 @@ class RasterMeasurements(BaseDataset):
         return datasets
 
     @classmethod
-    def from_area(cls, shp=None, pt=None, buffer=None, crs=26912, **kwargs):
-        if shp is None and pt is None:
-            raise ValueError(
-                "We need a shape description or a point and buffer")
-        if (pt is not None and buffer is None) or (
-                buffer is not None and pt is None):
-            raise ValueError("pt and buffer must be given together")
+    @instrumented
+    def from_area(cls, shp=None, pt=None, buffer=None, crs=26912,
+                  mosaic=None, max_workers=None, resolution=None,
+                  scale_factor=None, resample="NearestNeighbor", **kwargs):
+        """
+        Get the raster clipped to a specific shapefile or to a point and a
+        known buffer
+
+        Args:
+            shp: shapely geometry in which to filter
+            pt: shapely point that will have a buffer applied in order
+                to find search area
+            buffer: in same units as point
+            crs: integer crs to use
+            mosaic: 'server' to union the tiles in the database or 'client'
+                    to fetch them clipped in parallel and mosaic them
+                    locally. Defaults to cls.MOSAIC
+            max_workers: number of parallel tile requests for the client
+                         mosaic, defaults to cls.MOSAIC_WORKERS
+            resolution: pixel size to rescale to on the server before the
+                        raster is sent, in the units of the raster crs
+            scale_factor: factor to multiply the pixel size by on the server.
+                          Uses a raster overview with the filter columns
+                          when one exists
+            resample: postgis resampling algorithm used for rescaling
+            kwargs: for more filtering (cls.ALLOWED_QRY_KWARGS)
+        Returns: rasterio dataset
+        """
+        cls._check_area_args(shp=shp, pt=pt, buffer=buffer)
+        cls._check_rescale_args(resolution, scale_factor)
+        mosaic = mosaic or cls.MOSAIC
+        if mosaic not in ["server", "client"]:
+            raise ValueError(f"{mosaic} is not an allowed mosaic")
 
         with db_session(cls.DB_NAME) as (session, engine):
 
             try:
-                # Get shape ready for cropping with rasters
+                # Get shape ready for cropping with rasters, a buffer is
+                # computed as part of the raster query
                 if shp:
                     db_shp = from_shape(shp, srid=crs)
                 else:
-                    qry_pt = from_shape(pt)
-                    qry = session.query(
-                        gfunc.ST_SetSRID(
-                            func.ST_Buffer(qry_pt, buffer), crs
-                        )
-                    )
-                    db_shp = qry.all()[0][0]
-
-                # Grab the rasters, union and clip them
-                base_query = func.ST_AsTiff(func.ST_Clip(func.ST_Union(ImageData.raster, type_=Raster), db_shp, True))
-                q = session.query(base_query)
-                # Find all the tiles that
-                q = q.filter(gfunc.ST_Intersects(ImageData.raster, db_shp))
-
+                    db_shp = cls._buffered_point(pt, buffer, crs)
 
                 limit = kwargs.get("limit")
                 if limit:
                     kwargs.pop("limit")
-                q = cls.extend_qry(q, check_size=False, **kwargs)
-                rasters = q.all()
+
+                if mosaic == "client":
+                    # Find the tiles and clip them one by one
+                    q = session.query(cls.MODEL.id)
+                    q = q.filter(gfunc.ST_Intersects(ImageData.raster, db_shp))
+                    q = cls.extend_qry(q, check_size=False, **kwargs)
+                    dataset = cls._mosaic_tiles(
+                        q, db_shp=db_shp, max_workers=max_workers,
+                        resolution=resolution, scale_factor=scale_factor,
+                        resample=resample
+                    )
+                    return [] if dataset is None else dataset
+
+                # Grab the rasters, union and clip them
+                qry = cls._server_mosaic_query(
+                    session, db_shp=db_shp, check_size=False,
+                    resolution=resolution, scale_factor=scale_factor,
+                    resample=resample, **kwargs
+                )
+                rasters = qry.all()
 
                 # Get the rasterio object of the raster
                 datasets = raster_to_rasterio(rasters)
@@ -0,0 +1,315 @@
+"""
+Asyncio versions of the API classes so queries don't block an event loop.
+They run on sqlalchemy's async engine with the asyncpg driver, which is an
+optional dependency (pip install snowexsql[async]), and take the same
+filters as their counterparts in :py:mod:`snowexsql.api`.
+
+Only from_filter, from_area, from_unique_entries and the all_* properties
+are coroutines, e.g. :code:`await AsyncPointMeasurements().all_types`. The
+other query methods of the API classes don't exist on these classes, use
+the classes in :py:mod:`snowexsql.api` for them.
+"""
+import json
+import logging
+
+from geoalchemy2.shape import from_shape
+from sqlalchemy import func, select
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.orm import Query
+
+from snowexsql.api import (
+    LayerMeasurements, PointMeasurements, RasterMeasurements
+)
+from snowexsql.cache import freeze_kwargs
+from snowexsql.conversions import (
+    _binary_geometry_statement, _float_columns, _rows_to_geopandas,
+    raster_to_rasterio
+)
+from snowexsql.db import get_async_engine
+from snowexsql.functions import Explain
+from snowexsql.tables import RasterCatalog
+
+LOG = logging.getLogger(__name__)
+
+
+class _NotAsync:
+    """
+    Removes a method inherited from the API classes that has no asyncio
+    version, so it isn't run on the blocking engine by mistake. Looking it
+    up raises AttributeError like any missing attribute.
+    """
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        owner = owner or type(instance)
+        raise AttributeError(
+            f"{owner.__name__} has no attribute '{self.name}', it has no"
+            f" asyncio version so use the class in snowexsql.api instead"
+        )
+
+
+class AsyncDatasetMixin:
+    """
+    Replaces the database access of an API class with coroutines while
+    keeping its filtering from extend_qry
+    """
+    catalog = _NotAsync()
+    aggregate = _NotAsync()
+    from_filter_parallel = _NotAsync()
+
+    @classmethod
+    async def _execute(cls, statement):
+        """
+        Run a statement on the pooled async engine
+
+        Returns:
+            tuple: **columns** - list of column names
+                   **rows** - list of rows
+        """
+        engine = get_async_engine(cls.DB_NAME)
+        async with engine.connect() as conn:
+            result = await conn.execute(statement)
+            return list(result.keys()), result.fetchall()
+
+    @classmethod
+    async def _scalar(cls, statement):
+        columns, rows = await cls._execute(statement)
+        return rows[0][0]
+
+    @classmethod
+    async def _query_to_geopandas(cls, qry):
+        statement, geom_cols = _binary_geometry_statement(qry.statement)
+        columns, rows = await cls._execute(statement)
+        return _rows_to_geopandas(
+            rows, columns, geom_cols=geom_cols,
+            float_cols=_float_columns(statement)
+        )
+
+    @classmethod
+    async def _extend_qry(cls, qry, check_size=True, **kwargs):
+        """
+        Same as extend_qry but runs any size check queries asynchronously
+        """
+        qry = cls.extend_qry(qry, check_size=False, **kwargs)
+        if not check_size or "limit" in kwargs:
+            return qry
+
+        if cls.SIZE_CHECK_MODE == "estimate":
+            plan = await cls._scalar(Explain(qry.statement))
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            count = int(plan[0]["Plan"]["Plan Rows"])
+            if count > cls.MAX_RECORD_COUNT:
+                cls._raise_large_query(
+                    f"is estimated to return {count} number of records"
+                )
+
+        elif cls.SIZE_CHECK_MODE == "count":
+            count = await cls._scalar(
+                select(func.count()).select_from(qry.statement.subquery())
+            )
+            if count > cls.MAX_RECORD_COUNT:
+                cls._raise_large_query(
+                    f"will return {count} number of records"
+                )
+        else:
+            # The guard only limits the query, the callers check the results
+            qry = cls._check_size(qry, kwargs, guard=True)
+
+        return qry
+
+    @classmethod
+    async def from_unique_entries(cls, columns_to_search, **kwargs):
+        """Returns unique values from a column to help with filtering"""
+        columns = [getattr(cls.MODEL, column) for column in columns_to_search]
+        cache = cls.METADATA_CACHE
+        key = (
+            cls._table_key(), "unique", tuple(columns_to_search),
+            freeze_kwargs(kwargs)
+        )
+
+        try:
+            results = None
+            if cache is not None:
+                if cache.needs_validation(cls._table_key()):
+                    fingerprint = await cls._execute(select(
+                        func.max(cls.MODEL.time_created),
+                        func.max(cls.MODEL.time_updated)
+                    ))
+                    cache.update_fingerprint(
+                        cls._table_key(), tuple(fingerprint[1][0])
+                    )
+                results = cache.get(key)
+
+            if results is None:
+                qry = Query(columns)
+                qry = cls.extend_qry(qry, check_size=False, **kwargs)
+                _, results = await cls._execute(qry.distinct().statement)
+                if cache is not None:
+                    cache.set(key, results)
+
+        except Exception as e:
+            LOG.error("Failed query finding options for filtering")
+            raise e
+
+        if len(columns_to_search) == 1:
+            results = cls.retrieve_single_value_result(results)
+        else:
+            results = list(results)
+
+        return results
+
+
+class AsyncPointMeasurements(AsyncDatasetMixin, PointMeasurements):
+    """
+    Asyncio API class for access to PointData
+    """
+    iter_filter = _NotAsync()
+    iter_area = _NotAsync()
+    from_areas = _NotAsync()
+    sample_raster = _NotAsync()
+    nearest = _NotAsync()
+    grid = _NotAsync()
+
+    @classmethod
+    async def from_filter(cls, **kwargs):
+        """
+        Get data for the class by filtering by allowed arguments. The allowed
+        filters are cls.ALLOWED_QRY_KWARGS.
+        """
+        try:
+            qry = Query(cls.MODEL)
+            qry = await cls._extend_qry(qry, **kwargs)
+            df = await cls._query_to_geopandas(qry)
+            cls._check_result_size(df, kwargs)
+        except Exception as e:
+            LOG.error("Failed query for PointData")
+            raise e
+
+        return df
+
+    @classmethod
+    async def from_area(cls, shp=None, pt=None, buffer=None, crs=26912,
+                        geography=False, **kwargs):
+        """
+        Get data for the class within a specific shapefile or
+        within a point and a known buffer
+        Args:
+            shp: shapely geometry in which to filter
+            pt: shapely point that will have a buffer applied in order
+                to find search area
+            buffer: in same units as point
+            crs: integer crs to use
+            geography: measure the buffer in meters on the spheroid
+            kwargs: for more filtering or limiting (cls.ALLOWED_QRY_KWARGS)
+        Returns: Geopandas dataframe of results
+        """
+        cls._check_area_args(shp=shp, pt=pt, buffer=buffer)
+        qry = cls._filter_area(
+            Query(cls.MODEL), shp=shp, pt=pt, buffer=buffer, crs=crs,
+            geography=geography
+        )
+        qry = await cls._extend_qry(qry, **kwargs)
+        df = await cls._query_to_geopandas(qry)
+        cls._check_result_size(df, kwargs)
+        return df
+
+
+class AsyncLayerMeasurements(AsyncPointMeasurements, LayerMeasurements):
+    """
+    Asyncio API class for access to LayerData
+    """
+    pass
+
+
+class AsyncRasterMeasurements(AsyncDatasetMixin, RasterMeasurements):
+    """
+    Asyncio API class for access to ImageData. Tiles are always mosaicked
+    on the server.
+    """
+    datasets = _NotAsync()
+
+    @classmethod
+    async def check_for_single_dataset(cls, **kwargs):
+        """
+        Check that the user only requested one raster dataset, see
+        :py:meth:`snowexsql.api.RasterMeasurements.check_for_single_dataset`
+        """
+        qry = cls._current_catalog_query(Query([
+            getattr(RasterCatalog, c) for c in cls.DATASET_COLUMNS
+        ]), **kwargs)
+        rows = None
+        if qry is not None:
+            try:
+                _, rows = await cls._execute(qry.statement)
+            except ProgrammingError:
+                # The catalog hasn't been created in this database
+                pass
+
+        if rows:
+            cls._check_catalog_rows(rows)
+            return
+
+        for column in cls.DATASET_COLUMNS:
+            values = await cls.from_unique_entries([column], **kwargs)
+            cls._check_dataset_values(column, values)
+
+    @classmethod
+    async def from_filter(cls, resolution=None, scale_factor=None,
+                          resample="NearestNeighbor", **kwargs):
+        """
+        Get data for the class by filtering by allowed arguments. See
+        :py:meth:`snowexsql.api.RasterMeasurements.from_filter`
+
+        Returns: list of rasterio datasets
+        """
+        cls._check_rescale_args(resolution, scale_factor)
+        await cls.check_for_single_dataset(**kwargs)
+
+        try:
+            qry = cls._server_mosaic_query(
+                None, check_size=False, resolution=resolution,
+                scale_factor=scale_factor, resample=resample, **kwargs
+            )
+            _, rasters = await cls._execute(qry.statement)
+        except Exception as e:
+            LOG.error("Failed query for Raster Data")
+            raise e
+
+        return raster_to_rasterio(rasters)
+
+    @classmethod
+    async def from_area(cls, shp=None, pt=None, buffer=None, crs=26912,
+                        resolution=None, scale_factor=None,
+                        resample="NearestNeighbor", **kwargs):
+        """
+        Get the raster clipped to a specific shapefile or to a point and a
+        known buffer. See :py:meth:`snowexsql.api.RasterMeasurements.from_area`
+
+        Returns: rasterio dataset
+        """
+        cls._check_area_args(shp=shp, pt=pt, buffer=buffer)
+        cls._check_rescale_args(resolution, scale_factor)
+
+        if shp is not None:
+            db_shp = from_shape(shp, srid=int(crs))
+        else:
+            db_shp = cls._buffered_point(pt, buffer, crs)
+        kwargs.pop("limit", None)
+
+        try:
+            qry = cls._server_mosaic_query(
+                None, db_shp=db_shp, check_size=False,
+                resolution=resolution, scale_factor=scale_factor,
+                resample=resample, **kwargs
+            )
+            _, rasters = await cls._execute(qry.statement)
+        except Exception as e:
+            LOG.error("Failed query for Raster Data")
+            raise e
+
+        datasets = raster_to_rasterio(rasters)
+        if len(datasets) > 0:
+            return datasets[0]
+        return datasets
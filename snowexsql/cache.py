@@ -0,0 +1,317 @@
+"""
+Module contains caches used by the API to avoid repeating queries whose
+results rarely change, e.g. the unique values of a column used for filtering.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from os.path import expanduser, getsize, join
+
+import geopandas as gpd
+
+LOG = logging.getLogger(__name__)
+
+
+def freeze_kwargs(kwargs):
+    """
+    Convert a dictionary of filter kwargs into something hashable so it can
+    be used as part of a cache key. Lists are treated as unordered.
+
+    Args:
+        kwargs: dictionary of filter kwargs
+
+    Returns:
+        frozen: tuple of sorted (key, value) pairs
+    """
+    frozen = []
+    for k, v in sorted(kwargs.items()):
+        if isinstance(v, (list, tuple, set)):
+            v = tuple(sorted(v, key=repr))
+        frozen.append((k, v))
+    return tuple(frozen)
+
+
+class MetadataCache:
+    """
+    Bounded least recently used cache with a time to live for metadata
+    results. Keys are tuples whose first item identifies the table the
+    result came from so all entries for a table can be invalidated at once.
+
+    Args:
+        maxsize: Maximum number of entries kept
+        ttl: Seconds an entry is valid for
+        validate_interval: Seconds between checks of a table fingerprint,
+                           None disables the checks
+    """
+
+    def __init__(self, maxsize=256, ttl=600, validate_interval=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.validate_interval = validate_interval
+
+        self._entries = OrderedDict()
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for key or the default when it is missing or
+        expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Store a value, evicting the least recently used entry when full
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, table_key=None):
+        """
+        Remove all entries for a table or every entry when no table is given
+        """
+        with self._lock:
+            if table_key is None:
+                self._entries.clear()
+                self._fingerprints.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == table_key]:
+                    del self._entries[key]
+                self._fingerprints.pop(table_key, None)
+
+    def needs_validation(self, table_key):
+        """
+        Whether the fingerprint of a table is due to be checked
+        """
+        if self.validate_interval is None:
+            return False
+
+        with self._lock:
+            checked = self._fingerprints.get(table_key)
+        return checked is None or \
+            time.monotonic() - checked[0] >= self.validate_interval
+
+    def update_fingerprint(self, table_key, fingerprint):
+        """
+        Record the current fingerprint of a table, invalidating its entries
+        when it differs from the last one
+        """
+        with self._lock:
+            checked = self._fingerprints.get(table_key)
+        if checked is not None and checked[1] != fingerprint:
+            self.invalidate(table_key)
+
+        with self._lock:
+            self._fingerprints[table_key] = (time.monotonic(), fingerprint)
+
+    def fingerprint(self, table_key):
+        """
+        The last fingerprint recorded for a table, None if there is none
+        """
+        with self._lock:
+            checked = self._fingerprints.get(table_key)
+        return None if checked is None else checked[1]
+
+    def validate(self, table_key, fingerprint_func):
+        """
+        Invalidate the entries of a table when its fingerprint has changed.
+        The fingerprint is only requested once per validate_interval.
+
+        Args:
+            table_key: Key identifying the table
+            fingerprint_func: Callable returning the current fingerprint
+        """
+        if self.needs_validation(table_key):
+            self.update_fingerprint(table_key, fingerprint_func())
+
+
+class ResultCache:
+    """
+    Least recently used cache of query results on local disk. Each result is
+    stored as a GeoParquet file next to a small json file holding the
+    fingerprint of the table when it was fetched, a result is only returned
+    while the fingerprint still matches. Requires the optional pyarrow
+    dependency (pip install snowexsql[cache]).
+
+    Args:
+        path: Directory holding the cached files, defaults to
+              ~/.cache/snowexsql
+        max_bytes: Maximum total size of the cached results, the least
+                   recently used are removed beyond it
+        validate_interval: Seconds between fingerprint queries of a table,
+                           so results can be this much out of date. 0
+                           checks on every request, None only once.
+    """
+
+    def __init__(self, path=None, max_bytes=2 * 1024 ** 3,
+                 validate_interval=30):
+        # Optional dependency only needed to write GeoParquet
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError(
+                "The result cache needs pyarrow, install it with"
+                " pip install snowexsql[cache]"
+            )
+
+        self.path = path or join(expanduser("~"), ".cache", "snowexsql")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Throttles the fingerprint queries, only its fingerprints are used
+        self._tables = MetadataCache(validate_interval=validate_interval)
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def make_key(table_key, kind, kwargs, geometries=None):
+        """
+        Build the key of a result from the table it came from, the kind of
+        request, the filter kwargs and any geometries used to filter
+
+        Args:
+            table_key: Key identifying the table
+            kind: Name of the request, e.g. from_filter
+            kwargs: dictionary of filter kwargs
+            geometries: list of shapely geometries or None
+
+        Returns:
+            key: hex digest of the normalized request
+        """
+        digest = hashlib.sha256()
+        digest.update(repr((table_key, kind, freeze_kwargs(kwargs))).encode())
+        for geom in geometries or []:
+            digest.update(b"\0" if geom is None else geom.wkb)
+        return digest.hexdigest()
+
+    def fingerprint(self, table_key, fingerprint_func):
+        """
+        The fingerprint of a table, only requested once per
+        validate_interval
+
+        Args:
+            table_key: Key identifying the table
+            fingerprint_func: Callable returning the current fingerprint
+        """
+        fingerprint = self._tables.fingerprint(table_key)
+        if fingerprint is None or self._tables.needs_validation(table_key):
+            fingerprint = fingerprint_func()
+            self._tables.update_fingerprint(table_key, fingerprint)
+        return fingerprint
+
+    def _paths(self, key):
+        base = join(self.path, key)
+        return base + ".parquet", base + ".json"
+
+    def get(self, key, fingerprint):
+        """
+        Return the cached result for key or None when it is missing or was
+        fetched before the table changed
+
+        Args:
+            key: Key from make_key
+            fingerprint: Current fingerprint of the table
+        """
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as fp:
+                meta = json.load(fp)
+            if meta["fingerprint"] != repr(fingerprint):
+                self._remove(key)
+                return None
+            df = gpd.read_parquet(data_path)
+            # Mark as recently used
+            os.utime(data_path)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return df
+
+    def set(self, key, fingerprint, df):
+        """
+        Store a result then evict the least recently used results when the
+        cache is over max_bytes
+
+        Args:
+            key: Key from make_key
+            fingerprint: Fingerprint of the table the result came from
+            df: geopandas.GeoDataFrame to store
+        """
+        data_path, meta_path = self._paths(key)
+        # Write to temporary files first so readers never see partial files.
+        # The data is swapped in before the fingerprint so a reader never
+        # pairs the new fingerprint with older data.
+        tmp = f".{uuid.uuid4().hex}.tmp"
+        try:
+            df.to_parquet(data_path + tmp)
+            with open(meta_path + tmp, "w") as fp:
+                json.dump({"fingerprint": repr(fingerprint)}, fp)
+            os.replace(data_path + tmp, data_path)
+            os.replace(meta_path + tmp, meta_path)
+        except (OSError, ValueError) as e:
+            LOG.warning(f"Unable to cache the result: {e}")
+            self._remove(key, suffix=tmp)
+            return
+
+        self._evict()
+
+    def _remove(self, key, suffix=""):
+        for p in self._paths(key):
+            try:
+                os.remove(p + suffix)
+            except FileNotFoundError:
+                # Already removed, possibly by another process
+                pass
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.path):
+                if name.endswith(".parquet"):
+                    try:
+                        stat = os.stat(join(self.path, name))
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(name[:-len(".parquet")])
+                total -= size
+
+    def clear(self):
+        """Remove every cached result"""
+        with self._lock:
+            for name in os.listdir(self.path):
+                if name.endswith(".parquet"):
+                    self._remove(name[:-len(".parquet")])
+
+    def size(self):
+        """Total size in bytes of the cached results"""
+        return sum(
+            getsize(join(self.path, name)) for name in os.listdir(self.path)
+            if name.endswith(".parquet")
+        )
@@ -4,42 +4,174 @@ filetypes, datatypes, etc. Many tools here will be useful for most end users
 of the database.
 """
 
+from io import BytesIO
+from operator import attrgetter
+
 import geopandas as gpd
+import numpy as np
 import pandas as pd
-from geoalchemy2.shape import to_shape
+import rasterio
+import shapely
+from geoalchemy2.types import Geometry
 from rasterio import MemoryFile
+from rasterio.merge import merge
+from sqlalchemy import Float, Integer, LargeBinary, func, inspect
 from sqlalchemy.dialects import postgresql
 
-from snowexsql.tables import PointData
+from snowexsql.stats import query_stats
+
+
+def _wkb_to_geoseries(values, crs=None, index=None):
+    """
+    Decode a column of WKB or EWKB bytes in a single call
+
+    Args:
+        values: sequence of bytes, None for missing geometries
+        crs: crs of the geometry, defaults to the srid in the EWKB
+        index: index for the returned series
+
+    Returns:
+        geoms: geopandas.GeoSeries instance
+    """
+    geoms = shapely.from_wkb(np.asarray(values, dtype=object))
+    if crs is None:
+        srids = shapely.get_srid(geoms[~shapely.is_missing(geoms)])
+        if len(srids) and srids[0] > 0:
+            crs = int(srids[0])
+
+    return gpd.GeoSeries(geoms, index=index, crs=crs)
+
+
+def _column_to_array(values, column_type):
+    """
+    Convert a list of values from a single table column into a typed array
+    """
+    if isinstance(column_type, Float):
+        return np.array(values, dtype=float)
+
+    elif isinstance(column_type, Integer):
+        if any(v is None for v in values):
+            return pd.array(values, dtype="Int64")
+        return np.array(values, dtype=np.int64)
+
+    return np.array(values, dtype=object)
 
 
 def points_to_geopandas(results):
     """
-    Converts a successful query list into a geopandas data frame
+    Converts a successful query list into a geopandas data frame. Works with
+    a list of any of the table classes, e.g. PointData, LayerData or SiteData.
 
     Args:
-        results: List of PointData objects
+        results: List of table class objects, e.g. PointData
 
     Returns:
         df: geopandas.GeoDataFrame instance
     """
-    # grab all the attributes of the class to assign
-    if isinstance(results[0], PointData):
-        data = {a: [] for a in dir(PointData) if a[0:1] != '__'}
+    if len(results) == 0:
+        return gpd.GeoDataFrame()
 
-    for r in results:
-        for k in data.keys():
-            v = getattr(r, k)
+    # Only the mapped table columns, not methods or sqlalchemy internals
+    mapper = inspect(type(results[0]))
 
-            if k == 'geom':
-                v = to_shape(v)
-            data[k].append(v)
+    data = {}
+    geometry = None
+    for attr in mapper.column_attrs:
+        key = attr.key
+        column_type = attr.columns[0].type
+        values = list(map(attrgetter(key), results))
 
-    df = gpd.GeoDataFrame(data, geometry=data['geom'])
+        if isinstance(column_type, Geometry):
+            elements = [v for v in values if v is not None]
+            crs = None
+            if elements and elements[0].srid > 0:
+                crs = elements[0].srid
+            data[key] = _wkb_to_geoseries(
+                [None if v is None else bytes(v.data) for v in values],
+                crs=crs
+            )
+            geometry = geometry or key
+        else:
+            data[key] = _column_to_array(values, column_type)
+
+    df = gpd.GeoDataFrame(data, geometry=geometry)
     return df
 
 
-def query_to_geopandas(query, engine, **kwargs):
+def _binary_geometry_statement(statement):
+    """
+    Swap the geometry columns of a select statement for their EWKB as plain
+    bytes. This skips geoalchemy2's row by row result processing so the
+    geometries can be decoded all at once.
+
+    Args:
+        statement: sqlalchemy select statement
+
+    Returns:
+        tuple: **statement** - the modified select statement
+               **geom_cols** - list of names of the geometry columns
+    """
+    columns = []
+    geom_cols = []
+    for name, c in statement.selected_columns.items():
+        if isinstance(c.type, Geometry):
+            columns.append(func.ST_AsEWKB(c, type_=LargeBinary).label(name))
+            geom_cols.append(name)
+        else:
+            columns.append(c)
+
+    return statement.with_only_columns(*columns), geom_cols
+
+
+def _float_columns(statement):
+    """
+    Names of the float columns of a select statement
+    """
+    return [
+        name for name, c in statement.selected_columns.items()
+        if isinstance(c.type, Float)
+    ]
+
+
+def _rows_to_geopandas(rows, columns, geom_col='geom', geom_cols=None,
+                       crs=None, float_cols=None):
+    """
+    Build a geopandas dataframe from rows returned by a query where the
+    geometry columns hold EWKB bytes
+
+    Args:
+        rows: list of rows from a sqlalchemy result
+        columns: list of column names
+        geom_col: name of the geometry column to set as the active geometry
+        geom_cols: names of all the geometry columns, defaults to geom_col
+        crs: crs of the geometry, defaults to the srid of the geometries
+        float_cols: names of columns to return as floats even when every
+                    value is null
+
+    Returns:
+        df: geopandas.GeoDataFrame instance
+    """
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    for name in float_cols or []:
+        df[name] = df[name].astype(float)
+
+    for name in geom_cols or [geom_col]:
+        # Decode every geometry in the column in a single call
+        df[name] = _wkb_to_geoseries(df[name], crs=crs, index=df.index)
+
+    return gpd.GeoDataFrame(df, geometry=geom_col)
+
+
+def _binary_size(rows, columns, names):
+    """
+    Number of bytes held in the binary columns of query results
+    """
+    idx = [columns.index(name) for name in names]
+    return sum(len(r[i]) for r in rows for i in idx if r[i] is not None)
+
+
+def query_to_geopandas(query, engine, geom_col='geom', crs=None,
+                       vectorized=True, **kwargs):
     """
     Convert a GeoAlchemy2 Query meant for postgis to a geopandas dataframe.
     Requires that a geometry column is included
@@ -47,19 +179,79 @@ def query_to_geopandas(query, engine, **kwargs):
     Args:
         query: GeoAlchemy2.Query Object
         engine: sqlalchemy engine
+        geom_col: name of the geometry column
+        crs: crs of the geometry, defaults to the srid of the geometries
+        vectorized: Boolean for fetching the geometries as binary and
+                    decoding them all at once. When False or when other
+                    kwargs are given the query is handed to
+                    geopandas.GeoDataFrame.from_postgis instead
+        kwargs: passed to geopandas.GeoDataFrame.from_postgis
 
     Returns:
         df: geopandas.GeoDataFrame instance
     """
-    # Fill out the variables in the query
-    sql = query.statement.compile(dialect=postgresql.dialect())
+    if not vectorized or kwargs:
+        # Fill out the variables in the query
+        sql = query.statement.compile(dialect=postgresql.dialect())
 
-    # Get dataframe from geopandas using the query and engine
-    df = gpd.GeoDataFrame.from_postgis(sql, engine, **kwargs)
+        # Get dataframe from geopandas using the query and engine
+        return gpd.GeoDataFrame.from_postgis(
+            sql, engine, geom_col=geom_col, crs=crs, **kwargs
+        )
+
+    statement, geom_cols = _binary_geometry_statement(query.statement)
+    with query_stats.phase("fetch") as info:
+        with engine.connect() as conn:
+            result = conn.execute(statement)
+            columns = list(result.keys())
+            rows = result.fetchall()
+        info["rows"] = len(rows)
+        if query_stats.enabled:
+            info["bytes"] = _binary_size(rows, columns, geom_cols)
+
+    with query_stats.phase("decode") as info:
+        df = _rows_to_geopandas(
+            rows, columns, geom_col=geom_col, geom_cols=geom_cols, crs=crs,
+            float_cols=_float_columns(statement)
+        )
+        info["rows"] = len(rows)
 
     return df
 
 
+def iter_query_to_geopandas(query, engine, chunksize=10000, geom_col='geom',
+                            crs=None):
+    """
+    Stream the results of a GeoAlchemy2 Query meant for postgis as geopandas
+    dataframes using a server side cursor. Only chunksize records are held in
+    memory at a time. Requires that a geometry column is included
+
+    Args:
+        query: GeoAlchemy2.Query Object
+        engine: sqlalchemy engine
+        chunksize: max number of records in each dataframe
+        geom_col: name of the geometry column
+        crs: crs of the geometry, defaults to the srid of the geometries
+
+    Returns:
+        generator: geopandas.GeoDataFrame instances
+    """
+    statement, geom_cols = _binary_geometry_statement(query.statement)
+    float_cols = _float_columns(statement)
+    with engine.connect() as conn:
+        # Fetch from a server side cursor in batches of chunksize
+        result = conn.execution_options(yield_per=chunksize).execute(
+            statement
+        )
+        columns = list(result.keys())
+
+        for rows in result.partitions(chunksize):
+            yield _rows_to_geopandas(
+                rows, columns, geom_col=geom_col, geom_cols=geom_cols,
+                crs=crs, float_cols=float_cols
+            )
+
+
 def query_to_pandas(query, engine, **kwargs):
     """
     Convert a GeoAlchemy2 Query meant for postgis to a pandas dataframe.
@@ -80,9 +272,26 @@ def query_to_pandas(query, engine, **kwargs):
     return df
 
 
+def _open_raster(buffer):
+    """
+    Open a raster from the bytes returned by the database without a
+    temporary file. Bytes are read in place but a memoryview, which
+    psycopg2 returns for bytea, is copied once. Rasterio opens a file
+    object in a MemoryFile that is closed along with the dataset.
+
+    Args:
+        buffer: bytes like object holding a raster, e.g. from ST_AsTiff
+
+    Returns:
+        dataset: rasterio dataset
+    """
+    return rasterio.open(BytesIO(bytes(buffer)))
+
+
 def raster_to_rasterio(rasters):
     """
-    Retrieve the numpy array of a raster by converting to a temporary file
+    Retrieve the rasterio datasets of rasters returned by a query. The
+    datasets are opened in memory without a temporary file.
 
     Args:
         raster: list of :py:class:`geoalchemy2.types.Raster`
@@ -92,11 +301,102 @@ def raster_to_rasterio(rasters):
 
     """
     datasets = []
-    for r in rasters:
-        if r[0] is not None:
-            bdata = bytes(r[0])
-
-            with MemoryFile() as tmpfile:
-                tmpfile.write(bdata)
-                datasets.append(tmpfile.open())
+    with query_stats.phase("raster_decode") as info:
+        for r in rasters:
+            if r[0] is not None:
+                datasets.append(_open_raster(r[0]))
+        info["rows"] = len(datasets)
+        info["bytes"] = sum(len(r[0]) for r in rasters if r[0] is not None)
     return datasets
+
+
+def raster_to_numpy(rasters, indexes=None):
+    """
+    Retrieve the numpy arrays of rasters returned by a query along with
+    their georeferencing. Data is decoded in memory without a temporary
+    file.
+
+    Args:
+        raster: list of :py:class:`geoalchemy2.types.Raster`
+        indexes: band index or list of band indexes to read, defaults to
+                 all bands
+
+    Returns:
+        list: tuples of **array** - numpy array of the raster,
+                        **transform** - affine transform of the raster,
+                        **crs** - rasterio CRS of the raster
+    """
+    results = []
+    with query_stats.phase("raster_decode") as info:
+        for r in rasters:
+            if r[0] is not None:
+                with MemoryFile(r[0]) as memfile:
+                    with memfile.open() as dataset:
+                        results.append(
+                            (dataset.read(indexes), dataset.transform,
+                             dataset.crs)
+                        )
+        info["rows"] = len(results)
+        info["bytes"] = sum(len(r[0]) for r in rasters if r[0] is not None)
+    return results
+
+
+def merge_rasterio(datasets, method='last'):
+    """
+    Mosaic rasterio datasets, e.g. tiles of the same raster, into a single
+    in memory dataset. The input datasets are closed.
+
+    Args:
+        datasets: list of rasterio datasets sharing a crs and resolution
+        method: how overlapping pixels are merged, see rasterio.merge.merge.
+                Defaults to 'last' to match postgis's ST_Union
+
+    Returns:
+        dataset: rasterio dataset of the mosaic
+    """
+    profile = datasets[0].profile
+    with query_stats.phase("mosaic") as info:
+        arr, transform = merge(datasets, method=method)
+        info["rows"] = len(datasets)
+    for d in datasets:
+        d.close()
+
+    profile.update(
+        driver='GTiff', height=arr.shape[1], width=arr.shape[2],
+        count=arr.shape[0], transform=transform
+    )
+    # Drop any tiling or compression options of the inputs
+    for key in ['blockxsize', 'blockysize', 'tiled', 'compress',
+                'interleave']:
+        profile.pop(key, None)
+
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as dst:
+            dst.write(arr)
+        return _open_raster(memfile.read())
+
+
+def array_to_rasterio(arr, transform, crs, nodata=None, descriptions=None):
+    """
+    Wrap a numpy array in an in memory rasterio dataset
+
+    Args:
+        arr: numpy array of shape (bands, rows, cols)
+        transform: affine transform of the array
+        crs: crs of the array, anything rasterio accepts
+        nodata: value of the pixels without data
+        descriptions: optional list of a name for each band
+
+    Returns:
+        dataset: rasterio dataset opened on the array
+    """
+    with MemoryFile() as memfile:
+        with memfile.open(
+            driver='GTiff', height=arr.shape[1], width=arr.shape[2],
+            count=arr.shape[0], dtype=arr.dtype, crs=crs,
+            transform=transform, nodata=nodata
+        ) as dst:
+            dst.write(arr)
+            for i, description in enumerate(descriptions or [], start=1):
+                dst.set_band_description(i, description)
+        return _open_raster(memfile.read())
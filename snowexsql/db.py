@@ -3,44 +3,321 @@ This module contains tool used directly regarding the database. This includes
 getting a session, initializing the database, getting table attributes, etc.
 """
 
+import asyncio
 import json
+import os
+import threading
+import weakref
+from contextlib import asynccontextmanager
 
-from sqlalchemy import MetaData, create_engine
+from sqlalchemy import (
+    MetaData, PrimaryKeyConstraint, create_engine, inspect, text
+)
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateColumn, CreateIndex
 
+from snowexsql.stats import query_stats
 from snowexsql.tables.base import Base
 
+# Default connection pool settings used by the engine registry
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+POOL_RECYCLE = 1800
+POOL_PRE_PING = True
 
-def initialize(engine):
+# Tables partitioned by date when initialize is given water years
+PARTITIONED_TABLES = ["points", "layers"]
+
+# Summary of the images table with a row per raster dataset, see
+# snowexsql.tables.RasterCatalog
+RASTER_CATALOG = """
+    SELECT
+        instrument, date, observers, doi, type, description,
+        min(units) AS units,
+        count(*) AS tiles,
+        ST_Union(ST_Envelope(raster)) AS footprint,
+        min(abs(ST_ScaleX(raster))) AS pixel_width,
+        min(abs(ST_ScaleY(raster))) AS pixel_height,
+        min(ST_SRID(raster)) AS srid,
+        min(ST_BandNoDataValue(raster, 1)) AS nodata,
+        sum(ST_Width(raster)::bigint * ST_Height(raster)) AS pixels,
+        max(COALESCE(time_updated, time_created)) AS last_updated
+    FROM public.images
+    GROUP BY instrument, date, observers, doi, type, description
+"""
+
+# Process wide registry of pooled engines keyed by connection string
+_ENGINES = {}
+# Asyncio engines by event loop, then by connection string. A loop that's
+# gone drops its engines, dispose_async_engines closes them cleanly.
+_ASYNC_ENGINES = weakref.WeakKeyDictionary()
+_ENGINES_LOCK = threading.Lock()
+
+
+def initialize(engine, water_years=None):
     """
     Creates the original database from scratch, currently only for
-    point data
+    point data. The tables are created with their indexes, see
+    check_indexes for verifying an existing database.
 
+    Args:
+        engine: sqlalchemy engine
+        water_years: Optional list of water years, e.g. [2020, 2021]. When
+                     given the points and layers tables are partitioned by
+                     date with a partition for each water year and a
+                     default partition for any other dates, see
+                     create_partitions.
     """
     meta = Base.metadata
     meta.drop_all(bind=engine)
-    meta.create_all(bind=engine)
 
+    if water_years is None:
+        meta.create_all(bind=engine)
+        create_raster_catalog(engine)
+        return
+
+    partitioned = [t for t in meta.sorted_tables
+                   if t.name in PARTITIONED_TABLES]
+    meta.create_all(
+        bind=engine,
+        tables=[t for t in meta.sorted_tables if t not in partitioned]
+    )
+
+    partitioned_meta = MetaData()
+    for table in partitioned:
+        _partitioned_table(table, partitioned_meta)
+    partitioned_meta.create_all(bind=engine)
+
+    create_partitions(engine, water_years, default=True)
+    create_raster_catalog(engine)
 
-def get_db(db_str, credentials=None, return_metadata=False):
+
+def _partitioned_table(table, metadata):
     """
-    Returns the DB engine, MetaData, and session object
+    Copy a table into metadata as a table partitioned by a range of dates.
+    Postgres needs the partition key in the primary key so it becomes
+    (id, date) in the database, which means the date can't be null. The
+    models still map id alone.
+    """
+    partitioned = table.to_metadata(metadata)
+    # Flag the date first so the new key matches the key columns
+    partitioned.c.date.primary_key = True
+    partitioned.append_constraint(PrimaryKeyConstraint("id", "date"))
+    partitioned.c.id.autoincrement = True
+    partitioned.dialect_options["postgresql"]["partition_by"] = "RANGE (date)"
+    return partitioned
+
+
+def create_partitions(engine, water_years, default=False):
+    """
+    Add a partition for each water year, October 1st of the year before to
+    September 30th, to the partitioned tables. Queries filtering on date
+    only scan the partitions that can match. A new water year has to be
+    added before any of its data is loaded, records without a partition
+    otherwise land in the default partition and block adding it.
+
+    Args:
+        engine: sqlalchemy engine
+        water_years: list of water years as integers
+        default: Boolean to also create the default partition
+    """
+    with engine.begin() as conn:
+        for table in PARTITIONED_TABLES:
+            for year in water_years:
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS public.{table}_wy{year:d}"
+                    f" PARTITION OF public.{table} FOR VALUES"
+                    f" FROM ('{year - 1:d}-10-01') TO ('{year:d}-10-01')"
+                ))
+            if default:
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS public.{table}_default"
+                    f" PARTITION OF public.{table} DEFAULT"
+                ))
+
+
+def create_raster_catalog(engine):
+    """
+    Create the raster_catalog materialized view summarizing each raster
+    dataset in the images table, if it doesn't exist. The catalog is a
+    snapshot, refresh it after uploading rasters with
+    refresh_raster_catalog.
+
+    Args:
+        engine: sqlalchemy engine
+    """
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE MATERIALIZED VIEW IF NOT EXISTS public.raster_catalog AS"
+            + RASTER_CATALOG
+        ))
+        # A unique index allows refreshing without blocking readers
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_raster_catalog_dataset"
+            " ON public.raster_catalog"
+            " (instrument, date, observers, doi, type, description)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_raster_catalog_footprint"
+            " ON public.raster_catalog USING gist (footprint)"
+        ))
+
+
+def refresh_raster_catalog(engine, concurrently=True):
+    """
+    Rebuild the raster_catalog from the images table
+
+    Args:
+        engine: sqlalchemy engine
+        concurrently: Boolean to refresh without blocking queries of the
+                      catalog, which takes longer
+    """
+    option = " CONCURRENTLY" if concurrently else ""
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"REFRESH MATERIALIZED VIEW{option} public.raster_catalog"
+        ))
+
+
+def check_indexes(engine):
+    """
+    Compare the indexes declared on the tables with the ones in a database
+
+    Args:
+        engine: sqlalchemy engine
+
+    Returns:
+        dict: **missing** - names of declared indexes not in the database
+              **unused** - names of indexes in the database that have not
+                           been scanned since the statistics were reset,
+                           excluding primary keys and unique indexes
+    """
+    inspector = inspect(engine)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name, schema=table.schema):
+            continue
+        existing = {
+            idx["name"] for idx in
+            inspector.get_indexes(table.name, schema=table.schema)
+        }
+        missing += sorted(
+            idx.name for idx in table.indexes if idx.name not in existing
+        )
+
+    tables = [table.name for table in Base.metadata.sorted_tables]
+    with engine.connect() as conn:
+        # Scans of a partitioned table's index are counted on the indexes
+        # of its partitions
+        unused = conn.execute(text("""
+            SELECT i.relname
+            FROM pg_index AS x
+            JOIN pg_class AS i ON i.oid = x.indexrelid
+            JOIN pg_class AS t ON t.oid = x.indrelid
+            JOIN pg_namespace AS n ON n.oid = t.relnamespace
+            WHERE n.nspname = 'public' AND t.relname = ANY(:tables)
+              AND NOT x.indisunique AND NOT x.indisprimary
+              AND COALESCE((
+                  SELECT sum(s.idx_scan) FROM pg_stat_user_indexes AS s
+                  WHERE s.indexrelid = x.indexrelid OR s.indexrelid IN (
+                      SELECT inhrelid FROM pg_inherits
+                      WHERE inhparent = x.indexrelid
+                  )
+              ), 0) = 0
+            ORDER BY i.relname
+        """), dict(tables=tables)).scalars().all()
+
+    return dict(missing=missing, unused=list(unused))
+
+
+def add_missing_columns(engine):
+    """
+    Add the columns declared on the tables that are missing from a
+    database, e.g. LayerData.value_num on a database built before it
+    existed. Generated columns are filled as they are added. Run
+    create_indexes afterwards for any indexes on them.
+
+    Args:
+        engine: sqlalchemy engine
+
+    Returns:
+        list: table.column names of the columns added
+    """
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name, schema=table.schema):
+                continue
+            existing = {
+                c["name"] for c in
+                inspector.get_columns(table.name, schema=table.schema)
+            }
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                spec = CreateColumn(column).compile(dialect=engine.dialect)
+                name = engine.dialect.identifier_preparer.format_table(table)
+                conn.exec_driver_sql(f"ALTER TABLE {name} ADD COLUMN {spec}")
+                added.append(f"{table.name}.{column.name}")
+
+    return added
+
+
+def create_indexes(engine, concurrently=True):
+    """
+    Create the declared indexes that are missing from a database, e.g. one
+    built before they were declared. Building concurrently doesn't block
+    writes to the tables but takes longer and can't run in a transaction.
+    A concurrent build that fails leaves an invalid index behind that needs
+    to be dropped before trying again. Indexes of partitioned tables are
+    always built normally.
+
+    Args:
+        engine: sqlalchemy engine
+        concurrently: Boolean to build with CREATE INDEX CONCURRENTLY
+
+    Returns:
+        list: names of the indexes created
+    """
+    missing = set(check_indexes(engine)["missing"])
+    indexes = [
+        idx for table in Base.metadata.sorted_tables
+        for idx in table.indexes if idx.name in missing
+    ]
+
+    with engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT") as conn:
+        # Postgres can't build concurrently on a partitioned table
+        partitioned = set(conn.execute(text(
+            "SELECT c.relname FROM pg_partitioned_table AS p"
+            " JOIN pg_class AS c ON c.oid = p.partrelid"
+        )).scalars())
+
+        for idx in indexes:
+            options = idx.dialect_options["postgresql"]
+            previous = options["concurrently"]
+            options["concurrently"] = \
+                concurrently and idx.table.name not in partitioned
+            try:
+                conn.execute(CreateIndex(idx, if_not_exists=True))
+            finally:
+                options["concurrently"] = previous
+
+    return [idx.name for idx in indexes]
+
+
+def _build_db_url(db_str, credentials=None):
+    """
+    Form the full connection string for the database
 
     Args:
         db_str: Just the name of the database
         credentials: Path to a json file containing username and password for the database
-        return_metadata: Boolean indicating whether the metadata object is
-                         being returned, useful only for developers
 
     Returns:
-        tuple: **engine** - sqlalchemy Engine object for directly sending
-                            querys to the DB
-               **session** - sqlalchemy Session Object for using object
-                             relational mapping (ORM)
-               **metadata** (optional) - sqlalchemy MetaData object for
-                            modifying the database
+        db: connection string for sqlalchemy
     """
-
     # This library requires a postgres dialect and the psycopg2 driver
     prefix = f'postgresql+psycopg2://'
 
@@ -55,10 +332,210 @@ def get_db(db_str, credentials=None, return_metadata=False):
     else:
         db = f"{prefix}{db_str}"
 
-    # Always create a Session in UTC time
-    engine = create_engine(
-        db, echo=False, connect_args={
-            "options": "-c timezone=UTC"})
+    return db
+
+
+def get_engine(db_str, credentials=None, pool_size=None, max_overflow=None,
+               pool_recycle=None, pool_pre_ping=None):
+    """
+    Returns a pooled engine from the process wide registry, creating it on
+    first use. Engines are keyed by the connection string (including the
+    credentials) and the pool settings so repeated calls reuse the same
+    connection pool instead of connecting from scratch.
+
+    Args:
+        db_str: Just the name of the database
+        credentials: Path to a json file containing username and password
+                     for the database
+        pool_size: Number of connections kept open in the pool, defaults to
+                   POOL_SIZE
+        max_overflow: Number of connections allowed beyond pool_size,
+                      defaults to MAX_OVERFLOW
+        pool_recycle: Seconds after which a connection is replaced, defaults
+                      to POOL_RECYCLE
+        pool_pre_ping: Boolean to test connections on checkout, defaults to
+                       POOL_PRE_PING
+
+    Returns:
+        engine: sqlalchemy Engine object shared by the process
+    """
+    pool_settings = dict(
+        pool_size=POOL_SIZE if pool_size is None else pool_size,
+        max_overflow=MAX_OVERFLOW if max_overflow is None else max_overflow,
+        pool_recycle=POOL_RECYCLE if pool_recycle is None else pool_recycle,
+        pool_pre_ping=(
+            POOL_PRE_PING if pool_pre_ping is None else pool_pre_ping
+        ),
+    )
+    db = _build_db_url(db_str, credentials=credentials)
+    key = (db, tuple(sorted(pool_settings.items())))
+
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(key)
+        if engine is None:
+            # Always create a Session in UTC time
+            engine = create_engine(
+                db, echo=False, connect_args={
+                    "options": "-c timezone=UTC"}, **pool_settings)
+            query_stats.watch(engine)
+            _ENGINES[key] = engine
+
+    return engine
+
+
+def get_async_engine(db_str, credentials=None, pool_size=None,
+                     max_overflow=None, pool_recycle=None,
+                     pool_pre_ping=None):
+    """
+    Returns a pooled asyncio engine using the asyncpg driver from the
+    registry, creating it on first use. asyncpg connections belong to an
+    event loop so engines are kept per running loop. Close them with
+    :code:`await dispose_async_engines()` before the loop ends, or use
+    :code:`async with async_engines():`. Requires the optional asyncpg
+    dependency (pip install snowexsql[async]).
+
+    Args:
+        db_str: Just the name of the database
+        credentials: Path to a json file containing username and password
+                     for the database
+        pool_size: Number of connections kept open in the pool, defaults to
+                   POOL_SIZE
+        max_overflow: Number of connections allowed beyond pool_size,
+                      defaults to MAX_OVERFLOW
+        pool_recycle: Seconds after which a connection is replaced, defaults
+                      to POOL_RECYCLE
+        pool_pre_ping: Boolean to test connections on checkout, defaults to
+                       POOL_PRE_PING
+
+    Returns:
+        engine: sqlalchemy AsyncEngine object
+    """
+    # Optional dependency only needed for the asyncio API
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    pool_settings = dict(
+        pool_size=POOL_SIZE if pool_size is None else pool_size,
+        max_overflow=MAX_OVERFLOW if max_overflow is None else max_overflow,
+        pool_recycle=POOL_RECYCLE if pool_recycle is None else pool_recycle,
+        pool_pre_ping=(
+            POOL_PRE_PING if pool_pre_ping is None else pool_pre_ping
+        ),
+    )
+    db = _build_db_url(db_str, credentials=credentials).replace(
+        'postgresql+psycopg2://', 'postgresql+asyncpg://', 1
+    )
+    loop = asyncio.get_running_loop()
+    key = (db, tuple(sorted(pool_settings.items())))
+
+    with _ENGINES_LOCK:
+        loop_engines = _ASYNC_ENGINES.setdefault(loop, {})
+
+        engine = loop_engines.get(key)
+        if engine is None:
+            # Always create a Session in UTC time
+            engine = create_async_engine(
+                db, echo=False, connect_args={
+                    "server_settings": {"timezone": "UTC"}},
+                **pool_settings)
+            query_stats.watch(engine)
+            loop_engines[key] = engine
+
+    return engine
+
+
+async def dispose_async_engines():
+    """
+    Dispose of the asyncio engines of the running loop and remove them from
+    the registry. Await it before the loop ends, e.g. at the end of the
+    coroutine given to asyncio.run, so the connections are closed while the
+    loop can still run.
+    """
+    loop = asyncio.get_running_loop()
+    with _ENGINES_LOCK:
+        engines = list(_ASYNC_ENGINES.pop(loop, {}).values())
+
+    for engine in engines:
+        await engine.dispose()
+
+
+@asynccontextmanager
+async def async_engines():
+    """
+    Context disposing of the asyncio engines of the running loop on exit,
+    see dispose_async_engines
+    """
+    try:
+        yield
+    finally:
+        await dispose_async_engines()
+
+
+def dispose_engines(close=True):
+    """
+    Dispose of every engine in the registry and empty it.
+
+    Args:
+        close: Boolean indicating whether checked in connections are closed.
+               Use False after a fork so the parent's connections are left
+               alone and the child simply opens its own.
+    """
+    with _ENGINES_LOCK:
+        engines = list(_ENGINES.values())
+        _ENGINES.clear()
+
+    for engine in engines:
+        engine.dispose(close=close)
+
+
+def _reset_engines_after_fork():
+    """
+    Connections can't be shared across processes, so the child drops the
+    registry inherited from the parent without closing its sockets.
+    """
+    global _ENGINES_LOCK
+    _ENGINES_LOCK = threading.Lock()
+    dispose_engines(close=False)
+
+    for loop_engines in _ASYNC_ENGINES.values():
+        for engine in loop_engines.values():
+            engine.sync_engine.dispose(close=False)
+    _ASYNC_ENGINES.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_engines_after_fork)
+
+
+def get_db(db_str, credentials=None, return_metadata=False, pooled=False):
+    """
+    Returns the DB engine, MetaData, and session object
+
+    Args:
+        db_str: Just the name of the database
+        credentials: Path to a json file containing username and password for the database
+        return_metadata: Boolean indicating whether the metadata object is
+                         being returned, useful only for developers
+        pooled: Boolean indicating whether to use the shared engine from
+                :py:func:`get_engine` instead of creating a new one
+
+    Returns:
+        tuple: **engine** - sqlalchemy Engine object for directly sending
+                            querys to the DB
+               **session** - sqlalchemy Session Object for using object
+                             relational mapping (ORM)
+               **metadata** (optional) - sqlalchemy MetaData object for
+                            modifying the database
+    """
+
+    if pooled:
+        engine = get_engine(db_str, credentials=credentials)
+    else:
+        db = _build_db_url(db_str, credentials=credentials)
+
+        # Always create a Session in UTC time
+        engine = create_engine(
+            db, echo=False, connect_args={
+                "options": "-c timezone=UTC"})
 
     Session = sessionmaker(bind=engine)
     metadata = MetaData()
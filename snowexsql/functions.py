@@ -5,6 +5,8 @@ with ORM. Many function already exist in GeoAlchemy.functions module
 import geoalchemy2.functions as gfunc
 from geoalchemy2.types import CompositeType, Geometry, Raster
 from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
 from sqlalchemy.types import Float, Integer
 
 
@@ -37,3 +39,28 @@ class ST_Clip(gfunc.GenericFunction):
 class ST_Count(gfunc.GenericFunction):
     name = 'ST_Count'
     type = Integer
+
+
+class Explain(Executable, ClauseElement):
+    """
+    Wraps a statement in a postgres EXPLAIN returning the plan as JSON.
+    Bound parameters are kept so the planner sees the real values.
+    """
+    inherit_cache = False
+
+    def __init__(self, statement, analyze=False, buffers=False):
+        self.statement = statement
+        self.analyze = analyze
+        self.buffers = buffers
+
+
+@compiles(Explain, 'postgresql')
+def _compile_explain(element, compiler, **kw):
+    options = ['FORMAT JSON']
+    if element.analyze:
+        options.append('ANALYZE')
+    if element.buffers:
+        options.append('BUFFERS')
+
+    sql = compiler.process(element.statement, **kw)
+    return f"EXPLAIN ({', '.join(options)}) {sql}"
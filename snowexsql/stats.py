@@ -0,0 +1,247 @@
+"""
+Module for timing the work done by the API. When enabled, every statement
+run on the engines of the :py:mod:`snowexsql.db` registry is timed through
+sqlalchemy events and the API methods add timings of their own phases, e.g.
+decoding the geometries. Records are kept in :py:data:`query_stats`.
+
+Usage::
+
+    from snowexsql.stats import query_stats
+
+    query_stats.enable(explain_threshold=2)
+    PointMeasurements.from_filter(type="depth", limit=1000)
+    query_stats.summary()
+"""
+import functools
+import json
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import pandas as pd
+from sqlalchemy import event
+
+LOG = logging.getLogger(__name__)
+
+# Name of the API call the current statements and phases belong to
+_current_call = ContextVar("snowexsql_current_call", default=None)
+
+
+class QueryStats:
+    """
+    Collects timing records of statements, API calls and their phases. Each
+    record is a dictionary with the keys:
+
+        * kind - 'statement', 'call' or 'phase'
+        * name - phase or call name, the SQL command for statements
+        * call - name of the API call it happened in
+        * duration - wall time in seconds
+        * rows - number of records, when known
+        * bytes - size of the binary data decoded, when known
+        * statement - the SQL of statements
+        * plan - EXPLAIN (ANALYZE, BUFFERS) output of slow statements
+
+    Args:
+        maxlen: Number of records kept, the oldest are dropped first
+    """
+
+    def __init__(self, maxlen=10000):
+        self.records = deque(maxlen=maxlen)
+        self.callback = None
+        self.explain_threshold = None
+        self.enabled = False
+        # Engines whose statements are timed while enabled
+        self._engines = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def enable(self, callback=None, explain_threshold=None):
+        """
+        Start recording
+
+        Args:
+            callback: Callable receiving each record as it is made, e.g. to
+                      send it to a structured log or metrics system
+            explain_threshold: Seconds after which a SELECT statement is
+                               run again under EXPLAIN (ANALYZE, BUFFERS)
+                               and the plan kept with its record. None
+                               disables this.
+        """
+        self.callback = callback
+        self.explain_threshold = explain_threshold
+        with self._lock:
+            if not self.enabled:
+                for engine in self._engines:
+                    self._listen(engine)
+                self.enabled = True
+
+    def disable(self):
+        """Stop recording, the records are kept"""
+        with self._lock:
+            if self.enabled:
+                for engine in self._engines:
+                    event.remove(
+                        engine, "before_cursor_execute", self._before
+                    )
+                    event.remove(engine, "after_cursor_execute", self._after)
+                self.enabled = False
+
+    def watch(self, engine):
+        """
+        Time the statements of an engine while recording. The engines of
+        the snowexsql.db registry are watched as they are created.
+
+        Args:
+            engine: sqlalchemy Engine or AsyncEngine
+        """
+        # The statements of an asyncio engine run on its sync engine
+        engine = getattr(engine, "sync_engine", engine)
+        with self._lock:
+            if engine not in self._engines:
+                self._engines.add(engine)
+                if self.enabled:
+                    self._listen(engine)
+
+    def _listen(self, engine):
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    def clear(self):
+        """Remove all the records"""
+        self.records.clear()
+
+    def record(self, kind, name, duration, **info):
+        """
+        Add a record and hand it to the callback
+        """
+        record = dict(
+            kind=kind, name=name, call=_current_call.get(),
+            duration=duration, **info
+        )
+        self.records.append(record)
+        if self.callback is not None:
+            try:
+                self.callback(record)
+            except Exception as e:
+                # Never let a metrics problem break a query
+                LOG.warning(f"Query stats callback failed: {e}")
+
+    @contextmanager
+    def phase(self, name, kind="phase"):
+        """
+        Time a block of work. Yields a dictionary for adding details like
+        rows or bytes to the record.
+        """
+        info = {}
+        if not self.enabled:
+            yield info
+            return
+
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.record(kind, name, time.perf_counter() - start, **info)
+
+    @contextmanager
+    def call(self, name):
+        """
+        Time an API call, statements and phases inside it are tagged with
+        its name
+        """
+        if not self.enabled or _current_call.get() is not None:
+            # Nested calls are timed as part of the outer one
+            yield
+            return
+
+        token = _current_call.set(name)
+        try:
+            with self.phase(name, kind="call"):
+                yield
+        finally:
+            _current_call.reset(token)
+
+    def _before(self, conn, cursor, statement, parameters, context,
+                executemany):
+        context._snowexsql_start = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context,
+               executemany):
+        start = getattr(context, "_snowexsql_start", None)
+        if start is None:
+            return
+        duration = time.perf_counter() - start
+
+        info = dict(statement=statement, rows=cursor.rowcount)
+        if self.explain_threshold is not None and not executemany and \
+                duration > self.explain_threshold and \
+                statement.lstrip().upper().startswith("SELECT"):
+            info["plan"] = self._explain(conn, statement, parameters)
+
+        name = statement.split(None, 1)[0].upper() if statement else ""
+        self.record("statement", name, duration, **info)
+
+    @staticmethod
+    def _explain(conn, statement, parameters):
+        """
+        Run a statement again under EXPLAIN on a separate cursor so the
+        results of the original are untouched
+        """
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(
+                "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement,
+                parameters
+            )
+            plan = cursor.fetchone()[0]
+            return json.loads(plan) if isinstance(plan, str) else plan
+        except Exception as e:
+            LOG.warning(f"Unable to explain slow statement: {e}")
+            return None
+        finally:
+            cursor.close()
+
+    def to_dataframe(self):
+        """
+        Returns:
+            df: pandas.DataFrame with a row for each record
+        """
+        return pd.DataFrame(
+            list(self.records),
+            columns=["kind", "name", "call", "duration", "rows", "bytes",
+                     "statement", "plan"]
+        )
+
+    def summary(self):
+        """
+        Count, total, mean and max duration for each kind and name
+
+        Returns:
+            df: pandas.DataFrame indexed by kind and name
+        """
+        df = self.to_dataframe()
+        return df.groupby(["kind", "name"])["duration"].agg(
+            ["count", "sum", "mean", "max"]
+        )
+
+
+# Shared by the API, engines and conversions
+query_stats = QueryStats()
+
+
+def instrumented(method):
+    """
+    Decorator timing an API method and tagging its statements and phases
+    with the class and method name. Use below @classmethod.
+    """
+    @functools.wraps(method)
+    def wrapper(cls, *args, **kwargs):
+        if not query_stats.enabled:
+            return method(cls, *args, **kwargs)
+        with query_stats.call(f"{cls.__name__}.{method.__name__}"):
+            return method(cls, *args, **kwargs)
+
+    return wrapper
@@ -1,11 +1,13 @@
 from .image_data import ImageData
 from .layer_data import LayerData
 from .point_data import PointData
+from .raster_catalog import RasterCatalog
 from .site_data import SiteData
 
 __all__ = [
     'ImageData',
     'LayerData',
     'PointData',
+    'RasterCatalog',
     'SnowData',
 ]
@@ -1,5 +1,5 @@
 from geoalchemy2 import Raster
-from sqlalchemy import Column, String
+from sqlalchemy import Column, Index, String
 
 from .base import Base, Measurement
 
@@ -9,5 +9,10 @@ class ImageData(Base, Measurement):
     Class representing the images table. This table holds all images/rasters
     """
     __tablename__ = 'images'
+    # The GIST index on ST_ConvexHull(raster) is added by geoalchemy2
+    __table_args__ = (
+        Index('ix_images_type_date', 'type', 'date'),
+        {"schema": "public"},
+    )
     raster = Column(Raster)
     description = Column(String(1000))
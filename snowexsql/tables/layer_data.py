@@ -1,7 +1,11 @@
-from sqlalchemy import Column, Float, String
+from sqlalchemy import Column, Computed, Float, Index, String, func
 
 from .base import Base, Measurement, SingleLocationData
 
+# Values that cast to a float, the exponent is kept small enough that the
+# cast can't overflow
+NUMERIC_PATTERN = r"^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d{1,2})?\s*$"
+
 
 class LayerData(SingleLocationData, Measurement, Base):
     """
@@ -11,6 +15,18 @@ class LayerData(SingleLocationData, Measurement, Base):
     temperature etc...
     """
     __tablename__ = 'layers'
+    # Indexes for the API filters, the GIST index on geom is added by
+    # geoalchemy2
+    __table_args__ = (
+        Index('ix_layers_type_date', 'type', 'date'),
+        Index('ix_layers_date_brin', 'date', postgresql_using='brin'),
+        Index('ix_layers_site_name', 'site_name'),
+        Index('ix_layers_instrument', 'instrument'),
+        Index('ix_layers_site_id', 'site_id'),
+        Index('ix_layers_pit_id', 'pit_id'),
+        Index('ix_layers_type_value_num', 'type', 'value_num'),
+        {"schema": "public"},
+    )
 
     depth = Column(Float)
     site_id = Column(String(50))
@@ -21,4 +37,22 @@ class LayerData(SingleLocationData, Measurement, Base):
     sample_b = Column(String(20))
     sample_c = Column(String(20))
     value = Column(String(50))
+    # Numeric copy of value kept by the database, null when value isn't a
+    # number like hand hardness or grain type
+    value_num = Column(Float, Computed(
+        f"CASE WHEN value ~ '{NUMERIC_PATTERN}'"
+        f" THEN CAST(value AS double precision) END",
+        persisted=True
+    ))
     flags = Column(String(20))
+
+
+# GIST index matching the geography radius search of the API, from_area
+# with geography=True. Records without a srid can't be transformed so
+# they're left out of it and of the search.
+Index(
+    'ix_layers_geography',
+    func.geography(func.ST_Transform(LayerData.geom, 4326)),
+    postgresql_using='gist',
+    postgresql_where=func.ST_SRID(LayerData.geom) != 0,
+)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Float, Integer, String
+from sqlalchemy import Column, Float, Index, Integer, String, func
 
 from .base import Base, Measurement, SingleLocationData
 
@@ -10,7 +10,28 @@ class PointData(SingleLocationData, Measurement, Base):
     e.g. snow depths
     """
     __tablename__ = 'points'
+    # Indexes for the API filters, the GIST index on geom is added by
+    # geoalchemy2. BRIN on date is tiny and suits data loaded by campaign.
+    __table_args__ = (
+        Index('ix_points_type_date', 'type', 'date'),
+        Index('ix_points_date_brin', 'date', postgresql_using='brin'),
+        Index('ix_points_site_name', 'site_name'),
+        Index('ix_points_instrument', 'instrument'),
+        Index('ix_points_site_id', 'site_id'),
+        {"schema": "public"},
+    )
 
     version_number = Column(Integer)
     equipment = Column(String(50))
     value = Column(Float)
+
+
+# GIST index matching the geography radius search of the API, from_area
+# with geography=True. Records without a srid can't be transformed so
+# they're left out of it and of the search.
+Index(
+    'ix_points_geography',
+    func.geography(func.ST_Transform(PointData.geom, 4326)),
+    postgresql_using='gist',
+    postgresql_where=func.ST_SRID(PointData.geom) != 0,
+)
@@ -0,0 +1,52 @@
+from geoalchemy2 import Geometry
+from sqlalchemy import (
+    DDL, BigInteger, Column, Date, DateTime, Float, Integer, String, event
+)
+from sqlalchemy.orm import DeclarativeBase
+
+from .base import Base
+
+
+class ViewBase(DeclarativeBase):
+    """
+    Base class for views. It has its own metadata so the views are not
+    created or dropped with the tables.
+    """
+    __table_args__ = {"schema": "public"}
+
+
+class RasterCatalog(ViewBase):
+    """
+    Class representing the raster_catalog materialized view, a row per
+    raster dataset in the images table with a summary of its tiles. It is
+    created and refreshed with snowexsql.db.create_raster_catalog and
+    snowexsql.db.refresh_raster_catalog.
+    """
+    __tablename__ = 'raster_catalog'
+
+    # The columns identifying a dataset
+    instrument = Column(String(50), primary_key=True)
+    date = Column(Date, primary_key=True)
+    observers = Column(String(100), primary_key=True)
+    doi = Column(String(50), primary_key=True)
+    type = Column(String(50), primary_key=True)
+    description = Column(String(1000), primary_key=True)
+
+    units = Column(String(50))
+    tiles = Column(Integer)
+    # Union of the tile envelopes
+    footprint = Column(Geometry)
+    pixel_width = Column(Float)
+    pixel_height = Column(Float)
+    srid = Column(Integer)
+    nodata = Column(Float)
+    # Total number of pixels in the tiles
+    pixels = Column(BigInteger)
+    last_updated = Column(DateTime(timezone=True))
+
+
+# The catalog depends on the images table, so it's dropped along with the
+# tables instead of blocking their drop
+event.listen(Base.metadata, "before_drop", DDL(
+    "DROP MATERIALIZED VIEW IF EXISTS public.raster_catalog"
+))
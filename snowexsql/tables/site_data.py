@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Float, String
+from sqlalchemy import Column, Float, Index, String
 
 from .base import Base, SingleLocationData
 
@@ -9,7 +9,12 @@ class SiteData(SingleLocationData, Base):
     main data record but only support data for each site
     """
     __tablename__ = 'sites'
-    __table_args__ = {"schema": "public"}
+    __table_args__ = (
+        Index('ix_sites_site_id', 'site_id'),
+        Index('ix_sites_pit_id', 'pit_id'),
+        Index('ix_sites_site_name_date', 'site_name', 'date'),
+        {"schema": "public"},
+    )
 
     pit_id = Column(String(50))
     slope_angle = Column(Float)
@@ -1,13 +1,24 @@
+import os
 from os.path import join, dirname
 import geopandas as gpd
 import numpy as np
+import pandas as pd
 import pytest
-from datetime import date
+from datetime import date, timedelta
+from shapely.geometry import Point
+from geoalchemy2.shape import from_shape
+from geoalchemy2.types import Raster
+from sqlalchemy import Column, MetaData, String, Table
+from sqlalchemy.orm import Query, Session
 
 from snowexsql.api import (
-    PointMeasurements, LargeQueryCheckException, LayerMeasurements
+    PointMeasurements, LargeQueryCheckException, LayerMeasurements,
+    RasterMeasurements, TooManyRastersException
 )
+from snowexsql.cache import ResultCache
 from snowexsql.db import get_db, initialize
+from snowexsql.stats import query_stats
+from snowexsql.tables import PointData, RasterCatalog
 
 
 @pytest.fixture(scope="session")
@@ -54,6 +65,8 @@ class DBConnection:
         class Extended(self.CLZ):
             DB_NAME = f"{url.username}:{url.password}@{url.host}/{url.database}"
 
+        # The tables are rebuilt for every class so drop any cached metadata
+        Extended.clear_cache()
         yield Extended
 
 
@@ -100,6 +113,33 @@ class TestPointMeasurements(DBConnection):
             result, []
         )
 
+    def test_all_types_cached(self, clz):
+        """
+        Test the unique values are stored in the metadata cache
+        """
+        result = clz().all_types
+        key = (clz._table_key(), "unique", ("type",), ())
+        assert clz.METADATA_CACHE.get(key) is not None
+        assert clz().all_types == result
+
+    def test_from_filter_result_cache(self, clz, tmp_path):
+        """
+        Test results are stored on disk and reused while the table is
+        unchanged
+        """
+        pytest.importorskip("pyarrow")
+
+        class Extended(clz):
+            RESULT_CACHE = ResultCache(path=str(tmp_path))
+
+        kwargs = dict(date=date(2020, 5, 28), instrument='camera')
+        result = Extended.from_filter(**kwargs)
+        key = ResultCache.make_key(
+            Extended._table_key(), "from_filter", kwargs
+        )
+        assert os.path.exists(os.path.join(str(tmp_path), f"{key}.parquet"))
+        assert len(Extended.from_filter(**kwargs)) == len(result)
+
     @pytest.mark.parametrize(
         "kwargs, expected_length, mean_value", [
             ({
@@ -139,6 +179,66 @@ class TestPointMeasurements(DBConnection):
         with pytest.raises(expected_error):
             clz.from_filter(**kwargs)
 
+    @pytest.mark.parametrize("mode", ["guard", "estimate", "count"])
+    def test_size_check_modes(self, clz, mode):
+        """
+        Test each size check mode runs against the database
+        """
+        class Extended(clz):
+            SIZE_CHECK_MODE = mode
+
+        result = Extended.from_filter(instrument="magnaprobe")
+        assert len(result) == 0
+
+    def test_catalog(self, clz):
+        """
+        Test the catalog returns counts for every filterable column
+        """
+        result = clz.catalog(instrument="magnaprobe")
+        assert list(result.keys()) == clz._catalog_columns()
+        for counts in result.values():
+            assert len(counts) == 0
+
+    @pytest.mark.parametrize("by", [None, "site_name", ["site_name", "date"]])
+    def test_aggregate(self, clz, by):
+        """
+        Test the statistics are computed in the database
+        """
+        result = clz.aggregate(
+            by=by, stats=["count", "mean", "p50"], type="depth"
+        )
+        expected = [by] if isinstance(by, str) else list(by or [])
+        assert list(result.columns) == expected + ["count", "mean", "p50"]
+        if by is None:
+            # A single row even with no records
+            assert result["count"].tolist() == [0]
+        else:
+            assert len(result) == 0
+
+    @pytest.mark.parametrize("as_rasterio", [False, True])
+    def test_grid(self, clz, as_rasterio):
+        """
+        Test the records are binned in the database, an empty grid has a
+        count of 0 and nan means
+        """
+        bounds = (743000, 4321000, 744000, 4322000)
+        result = clz.grid(
+            100, bounds=bounds, stats=["count", "mean"], type="depth",
+            as_rasterio=as_rasterio
+        )
+        if as_rasterio:
+            assert result.descriptions == ("count", "mean")
+            assert result.transform.c == 743000
+            arr = result.read()
+            result.close()
+        else:
+            arr, transform, crs = result
+            assert transform.f == 4322000
+            assert crs.to_epsg() == 26912
+        assert arr.shape == (2, 10, 10)
+        assert (arr[0] == 0).all()
+        assert np.isnan(arr[1]).all()
+
     def test_from_area(self, clz):
         shp = gpd.points_from_xy(
             [743766.4794971556], [4321444.154620216], crs="epsg:26912"
@@ -158,6 +258,162 @@ class TestPointMeasurements(DBConnection):
         )
         assert len(result) == 0
 
+    def test_from_areas(self, clz):
+        """
+        Test many shapes are joined in one query and label the results
+        """
+        areas = gpd.GeoDataFrame(
+            {"plot": ["north", "south"]},
+            geometry=gpd.points_from_xy(
+                [743766, 743800], [4321444, 4321500]
+            ).buffer(10),
+            crs="epsg:26912"
+        )
+        result = clz.from_areas(areas, id_col="plot", type="depth")
+        assert len(result) == 0
+        assert "plot" in result.columns
+
+    def test_nearest(self, clz):
+        result = clz.nearest(
+            Point(743766.4794971556, 4321444.154620216), k=5, type="depth"
+        )
+        assert len(result) == 0
+
+    def test_nearest_many(self, clz):
+        """
+        Test searching around several points in one query
+        """
+        pts = gpd.GeoSeries(
+            gpd.points_from_xy([743766, 743800], [4321444, 4321500]),
+            index=["a", "b"], crs="epsg:26912"
+        )
+        result = clz.nearest(pts, k=2, type="depth")
+        assert len(result) == 0
+        assert "query_id" in result.columns
+
+    def test_from_area_point_geography(self, clz):
+        """
+        Test a radius in meters on the spheroid
+        """
+        pts = gpd.points_from_xy([743766.4794971556], [4321444.154620216])
+        result = clz.from_area(
+            pt=pts[0], buffer=10, crs=26912, geography=True,
+            date=date(2019, 10, 30)
+        )
+        assert len(result) == 0
+
+    def test_from_filter_parallel(self, clz):
+        """
+        Test a list of dates is split into concurrent queries
+        """
+        result = clz.from_filter_parallel(
+            date=[date(2020, 5, 28), date(2019, 10, 3)], instrument="camera"
+        )
+        assert len(result) == 0
+
+    def test_sample_raster(self, clz):
+        """
+        Test sampling a raster at the point locations
+        """
+        result = clz.sample_raster(
+            raster_filter={"type": "depth", "observers": "ASO Inc."},
+            instrument="magnaprobe", value_column="lidar_depth"
+        )
+        assert "lidar_depth" in result.columns
+        assert len(result) == 0
+
+    def test_iter_filter(self, clz):
+        """
+        Test streaming the results in chunks
+        """
+        chunks = list(clz.iter_filter(chunksize=10, instrument="magnaprobe"))
+        assert sum(len(c) for c in chunks) == 0
+
+    def test_iter_area(self, clz):
+        shp = gpd.points_from_xy(
+            [743766.4794971556], [4321444.154620216], crs="epsg:26912"
+        ).buffer(10)[0]
+        chunks = list(clz.iter_area(shp=shp, chunksize=10))
+        assert sum(len(c) for c in chunks) == 0
+
+
+class TestPointMeasurementsWithData(DBConnection):
+    """
+    Test the catalog and the caches against records in the database
+    """
+
+    @staticmethod
+    def point(**kwargs):
+        return PointData(
+            geom=from_shape(Point(743766, 4321444), srid=26912),
+            date=date(2020, 2, 1), **kwargs
+        )
+
+    @pytest.fixture(scope="class")
+    def session(self, db):
+        session = Session(db)
+        session.add_all([
+            self.point(type="depth", instrument="magnaprobe", value=90),
+            self.point(type="depth", instrument="magnaprobe", value=94),
+            self.point(type="depth", instrument="pit ruler", value=92),
+            self.point(type="swe", instrument="pit ruler", value=300),
+        ])
+        session.commit()
+        yield session
+        session.close()
+
+    @pytest.fixture
+    def validate_always(self, clz, monkeypatch):
+        """
+        Check the table fingerprint on every request
+        """
+        monkeypatch.setattr(clz.METADATA_CACHE, "validate_interval", 0)
+
+    def test_catalog_counts(self, clz, session):
+        """
+        Test the grouping sets are split into counts per column
+        """
+        result = clz.catalog()
+        assert result["type"].to_dict() == {"depth": 3, "swe": 1}
+        assert result["instrument"].to_dict() == \
+            {"magnaprobe": 2, "pit ruler": 2}
+        assert result["date"].to_dict() == {date(2020, 2, 1): 4}
+
+        result = clz.catalog(type="depth")
+        assert result["instrument"].to_dict() == \
+            {"magnaprobe": 2, "pit ruler": 1}
+
+    def test_metadata_cache_invalidated(self, clz, session, validate_always):
+        """
+        Test cached values and catalogs are replaced after an insert
+        """
+        assert sorted(clz().all_types) == ["depth", "swe"]
+        assert clz.catalog()["type"].sum() == 4
+
+        session.add(self.point(type="density", instrument="cutter"))
+        session.commit()
+        assert sorted(clz().all_types) == ["density", "depth", "swe"]
+        assert clz.catalog()["type"].to_dict() == \
+            {"depth": 3, "density": 1, "swe": 1}
+
+    def test_result_cache_invalidated(self, clz, session, tmp_path):
+        """
+        Test a stored result isn't returned once the table changes
+        """
+        pytest.importorskip("pyarrow")
+
+        class Extended(clz):
+            RESULT_CACHE = ResultCache(
+                path=str(tmp_path), validate_interval=0
+            )
+
+        assert len(Extended.from_filter(type="swe")) == 1
+        assert len(Extended.from_filter(type="swe")) == 1
+
+        session.add(self.point(type="swe", instrument="pit ruler", value=310))
+        session.commit()
+        assert len(Extended.from_filter(type="swe")) == 2
+
 
 class TestLayerMeasurements(DBConnection):
     """
@@ -204,11 +460,16 @@ class TestLayerMeasurements(DBConnection):
                 "date_greater_equal": date(2020, 5, 13),
                 "type": 'density'
             }, 0, np.nan),
+            ({
+                "value_greater_equal": 200, "value_less_equal": 300,
+                "type": 'density'
+            }, 0, np.nan),
         ]
     )
     def test_from_filter(self, clz, kwargs, expected_length, mean_value):
         result = clz.from_filter(**kwargs)
         assert len(result) == expected_length
+        assert result["value_num"].dtype == float
         if expected_length > 0:
             assert pytest.approx(
                 result["value"].astype("float").mean()
@@ -248,3 +509,437 @@ class TestLayerMeasurements(DBConnection):
             type="density",
         )
         assert len(result) == 0
+
+
+class TestRasterMeasurements(DBConnection):
+    """
+    Test the Raster Measurement class
+    """
+    CLZ = RasterMeasurements
+
+    def test_all_descriptions(self, clz):
+        result = clz().all_descriptions
+        assert result == []
+
+    @pytest.mark.parametrize("mosaic", ["server", "client"])
+    def test_from_filter(self, clz, mosaic):
+        result = clz.from_filter(
+            mosaic=mosaic, type="depth", date=date(2020, 2, 1)
+        )
+        assert result == []
+
+    @pytest.mark.parametrize("mosaic", ["server", "client"])
+    def test_from_area(self, clz, mosaic):
+        shp = gpd.points_from_xy(
+            [743766.4794971556], [4321444.154620216], crs="epsg:26912"
+        ).buffer(100)[0]
+        result = clz.from_area(shp=shp, mosaic=mosaic, type="depth")
+        assert result == []
+
+    @pytest.mark.parametrize("mosaic", ["server", "client"])
+    @pytest.mark.parametrize("rescale", [
+        {"resolution": 50}, {"scale_factor": 4}
+    ])
+    def test_from_area_rescaled(self, clz, mosaic, rescale):
+        shp = gpd.points_from_xy(
+            [743766.4794971556], [4321444.154620216], crs="epsg:26912"
+        ).buffer(100)[0]
+        result = clz.from_area(shp=shp, mosaic=mosaic, type="depth", **rescale)
+        assert result == []
+
+    def test_datasets(self, clz):
+        result = clz.datasets(type="depth")
+        assert len(result) == 0
+
+    def test_check_for_single_dataset(self, clz):
+        clz.check_for_single_dataset(type="depth")
+
+    def test_from_filter_rescale_args(self, clz):
+        with pytest.raises(ValueError):
+            clz.from_filter(resolution=50, scale_factor=4, type="depth")
+
+    def test_from_area_bad_mosaic(self, clz):
+        shp = gpd.points_from_xy(
+            [743766.4794971556], [4321444.154620216], crs="epsg:26912"
+        ).buffer(100)[0]
+        with pytest.raises(ValueError):
+            clz.from_area(shp=shp, mosaic="notamosaic")
+
+
+class TestSizeCheck:
+    """
+    Test the large query safeguards that don't need a database
+    """
+
+    def test_guard_limits_query(self):
+        qry = PointMeasurements.extend_qry(
+            Query(PointData), check_size=False, type="depth"
+        )
+        qry = PointMeasurements._check_size(qry, {}, guard=True)
+        limit = PointMeasurements.MAX_RECORD_COUNT + 1
+        assert qry._limit_clause.value == limit
+
+    def test_guard_respects_limit(self):
+        qry = PointMeasurements.extend_qry(
+            Query(PointData), type="depth", limit=5000
+        )
+        qry = PointMeasurements._check_size(qry, {"limit": 5000}, guard=True)
+        assert qry._limit_clause.value == 5000
+
+    def test_extend_qry_raises(self, monkeypatch):
+        """
+        Test extend_qry on its own still raises in guard mode instead of
+        quietly truncating the results
+        """
+        monkeypatch.setattr(Query, "count", lambda self: 5000)
+        with pytest.raises(LargeQueryCheckException):
+            PointMeasurements.extend_qry(Query(PointData), type="depth")
+
+    @pytest.mark.parametrize("n_results, kwargs, raises", [
+        (1000, {}, False),
+        (1001, {}, True),
+        (1001, {"limit": 5000}, False),
+    ])
+    def test_check_result_size(self, n_results, kwargs, raises):
+        results = [None] * n_results
+        if raises:
+            with pytest.raises(LargeQueryCheckException):
+                PointMeasurements._check_result_size(results, kwargs)
+        else:
+            PointMeasurements._check_result_size(results, kwargs)
+
+    def test_bad_mode(self):
+        class Extended(PointMeasurements):
+            SIZE_CHECK_MODE = "notamode"
+
+        with pytest.raises(ValueError):
+            Extended.extend_qry(Query(PointData), type="depth")
+
+
+@pytest.mark.parametrize("clz, expected", [
+    (PointMeasurements, "points.value >="),
+    (LayerMeasurements, "layers.value_num >="),
+])
+def test_value_range_column(clz, expected):
+    """
+    Test layer values are compared as numbers
+    """
+    qry = clz.extend_qry(
+        Query(clz.MODEL), check_size=False, value_greater_equal=200
+    )
+    assert expected in str(qry.statement)
+
+
+@pytest.mark.parametrize("clz, expected", [
+    (PointMeasurements,
+     ["site_name", "site_id", "date", "instrument", "observers", "type"]),
+    (LayerMeasurements,
+     ["site_name", "site_id", "date", "instrument", "observers", "type",
+      "pit_id"]),
+    (RasterMeasurements,
+     ["site_name", "date", "instrument", "observers", "type",
+      "description"]),
+])
+def test_catalog_columns(clz, expected):
+    """
+    Test only exact value filters that are real columns are cataloged
+    """
+    assert clz._catalog_columns() == expected
+
+
+@pytest.mark.parametrize("stat, expected", [
+    ("mean", "avg(public.layers.value_num)"),
+    ("std", "stddev_samp(public.layers.value_num)"),
+    ("p50", "WITHIN GROUP (ORDER BY public.layers.value_num)"),
+    ("p99.5", "WITHIN GROUP (ORDER BY public.layers.value_num)"),
+])
+def test_aggregate_function(stat, expected):
+    """
+    Test the statistics and percentiles of layer values
+    """
+    value = LayerMeasurements._range_column("value")
+    assert expected in str(LayerMeasurements._aggregate_function(stat, value))
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"stats": ["median"]},
+    {"stats": ["p101"]},
+    {"by": "notacolumn"},
+])
+def test_aggregate_fails(kwargs):
+    """
+    Test bad statistics and columns fail before querying
+    """
+    with pytest.raises(ValueError):
+        PointMeasurements.aggregate(**kwargs)
+
+
+@pytest.mark.parametrize("kwargs, expected", [
+    ({"shp": Point(0, 0).buffer(10)}, "ST_Within"),
+    ({"pt": Point(0, 0), "buffer": 10}, "ST_DWithin(public.points.geom"),
+    ({"pt": Point(0, 0), "buffer": 10, "geography": True},
+     "ST_SRID(public.points.geom) != :ST_SRID_1 AND "
+     "ST_DWithin(geography(ST_Transform(public.points.geom"),
+])
+def test_filter_area(kwargs, expected):
+    """
+    Test a point and buffer is a distance check in the same statement
+    """
+    qry = PointMeasurements._filter_area(
+        Query(PointMeasurements.MODEL), **kwargs
+    )
+    assert expected in str(qry.statement)
+    assert "ST_Buffer" not in str(qry.statement)
+
+
+@pytest.mark.parametrize("positions, expected", [
+    ([], []),
+    ([1, 0, 1], ["south", "north", "south"]),
+])
+def test_label_positions(positions, expected):
+    """
+    Test results are labeled by position, including no matches which come
+    back as an object column
+    """
+    df = pd.DataFrame({"area_id": pd.Series(positions, dtype=object)})
+    result = PointMeasurements._label_positions(
+        df, "area_id", pd.Index(["north", "south"])
+    )
+    assert list(result["area_id"]) == expected
+
+
+def test_from_areas_bad_id_col():
+    areas = gpd.GeoSeries([Point(0, 0).buffer(10)])
+    with pytest.raises(ValueError):
+        PointMeasurements.from_areas(areas, id_col="plot")
+
+
+@pytest.mark.parametrize("kwargs, expected", [
+    ({"type": "depth", "instrument": ["lidar", "insar"]},
+     "raster_catalog.instrument IN"),
+    ({"date_greater_equal": date(2020, 1, 1)}, "raster_catalog.date >="),
+    ({"site_name": "Grand Mesa"}, None),
+])
+def test_catalog_query(kwargs, expected):
+    """
+    Test filters are applied to the raster catalog when it has the columns
+    """
+    qry = RasterMeasurements._catalog_query(Query(RasterCatalog), **kwargs)
+    if expected is None:
+        assert qry is None
+    else:
+        assert expected in str(qry.statement)
+
+
+def test_current_catalog_query():
+    """
+    Test the catalog is only used while it matches the images table
+    """
+    qry = RasterMeasurements._current_catalog_query(
+        Query(RasterCatalog), type="depth"
+    )
+    sql = str(qry.statement)
+    assert "raster_catalog.type =" in sql
+    assert "sum(public.raster_catalog.tiles)" in sql
+    assert "FROM public.images" in sql
+    assert RasterMeasurements._current_catalog_query(
+        Query(RasterCatalog), site_name="Grand Mesa"
+    ) is None
+
+
+def test_check_catalog_rows():
+    """
+    Test datasets with different values in the catalog are rejected
+    """
+    row = ("lidar", date(2020, 2, 1), "ASO", "doi", "depth", None)
+    RasterMeasurements._check_catalog_rows([row])
+    with pytest.raises(TooManyRastersException):
+        RasterMeasurements._check_catalog_rows(
+            [row, ("lidar", date(2020, 2, 8), "ASO", "doi", "depth", None)]
+        )
+
+
+def test_nearest_query():
+    """
+    Test the records are ordered with the index assisted <-> operator
+    """
+    qry = LayerMeasurements._nearest_query(
+        Session(), from_shape(Point(0, 0), srid=26912), 3, type="density"
+    )
+    sql = str(qry.statement)
+    assert "ORDER BY public.layers.geom <->" in sql
+    assert "LIMIT" in sql
+    with pytest.raises(ValueError):
+        LayerMeasurements._nearest_query(
+            Session(), from_shape(Point(0, 0), srid=26912), 3, limit=10
+        )
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"cell_size": 0},
+    {"cell_size": 10, "stats": ["median"]},
+    {"cell_size": 10, "column": "notacolumn"},
+    {"cell_size": 10, "limit": 10},
+])
+def test_grid_fails(kwargs):
+    """
+    Test bad grids fail before querying
+    """
+    with pytest.raises(ValueError):
+        PointMeasurements.grid(**kwargs)
+
+
+def test_sample_query():
+    """
+    Test the records are transformed to a constant srid so the raster
+    tiles can be found through the spatial index
+    """
+    qry = PointMeasurements._sample_query(
+        Session(), 26912, 1, {"type": "depth"}
+    )
+    sql = str(qry.statement.compile(compile_kwargs={"literal_binds": True}))
+    assert "ST_Intersects(public.images.raster, " \
+           "ST_Transform(public.points.geom, 26912))" in sql
+    assert "ST_SRID" not in sql
+
+
+def test_tile_raster_grid():
+    """
+    Test client mosaic tiles are resampled onto one shared grid
+    """
+    raster = RasterMeasurements._tile_raster(
+        grid=(743000.0, 4324500.0, 50.0, 50.0)
+    )
+    sql = raster.compile(compile_kwargs={"literal_binds": True})
+    assert "ST_Resample(public.images.raster, 50.0, -50.0, 743000.0, " \
+           "4324500.0" in str(sql)
+    assert RasterMeasurements._tile_raster() is RasterMeasurements.MODEL.raster
+
+
+@pytest.mark.parametrize("columns, kwargs, expected", [
+    # raster2pgsql overviews can't tell datasets apart
+    (["rid"], {"type": "depth"}, None),
+    (["rid"], {"limit": 1}, ""),
+    (["rid", "type", "date"], {"type": "depth", "date": date(2020, 2, 1)},
+     "WHERE public.o_4_images.type = :type_1 AND public.o_4_images.date"),
+])
+def test_filter_overview(columns, kwargs, expected):
+    """
+    Test an overview is only filtered when it has the filter columns
+    """
+    overview = Table(
+        "o_4_images", MetaData(), *[Column(c, String) for c in columns],
+        Column("rast", Raster), schema="public"
+    )
+    qry = RasterMeasurements._filter_source(
+        Query([overview.c.rast]), overview.c, **kwargs
+    )
+    if expected is None:
+        assert qry is None
+    else:
+        assert expected in str(qry.statement)
+
+
+def test_server_mosaic_size_check(monkeypatch):
+    """
+    Test the size check counts the tiles instead of the single row union
+    """
+    checked = []
+    monkeypatch.setattr(
+        RasterMeasurements, "_check_size",
+        classmethod(lambda cls, qry, kwargs: checked.append(qry) or qry)
+    )
+    RasterMeasurements._server_mosaic_query(None, type="depth")
+    sql = str(checked[0].statement)
+    assert "ST_Union" not in sql
+    assert "SELECT public.images.id" in sql
+
+
+@pytest.mark.parametrize("kwargs, expected", [
+    ({}, None),
+    ({"resolution": 50}, "ST_Rescale"),
+    ({"scale_factor": 4}, "ST_ScaleX"),
+])
+def test_raster_rescale(kwargs, expected):
+    """
+    Test the raster is only rescaled when asked
+    """
+    raster = RasterMeasurements._rescale(
+        RasterMeasurements.MODEL.raster, **kwargs
+    )
+    if expected is None:
+        assert raster is RasterMeasurements.MODEL.raster
+    else:
+        assert expected in str(raster)
+
+
+@pytest.mark.parametrize("kwargs, expected", [
+    # Nothing to split
+    ({"type": "depth"}, [{"type": "depth"}]),
+    # First list is split one value at a time
+    ({"type": "depth", "site_name": ["a", "b"]},
+     [{"type": "depth", "site_name": "a"},
+      {"type": "depth", "site_name": "b"}]),
+    # Batches of values
+    ({"site_name": ["a", "b", "c"], "batch_size": 2},
+     [{"site_name": ["a", "b"]}, {"site_name": ["c"]}]),
+    # Dates are always split one at a time
+    ({"date": [date(2020, 2, 1), date(2020, 2, 2)], "batch_size": 2},
+     [{"date": date(2020, 2, 1)}, {"date": date(2020, 2, 2)}]),
+    # Choose which list to split
+    ({"type": ["depth", "swe"], "site_name": ["a", "b"],
+      "split_on": "site_name"},
+     [{"type": ["depth", "swe"], "site_name": "a"},
+      {"type": ["depth", "swe"], "site_name": "b"}]),
+    # Date ranges split into windows
+    ({"date_greater_equal": date(2020, 2, 1),
+      "date_less_equal": date(2020, 2, 10),
+      "date_step": timedelta(days=7)},
+     [{"date_greater_equal": date(2020, 2, 1),
+       "date_less_equal": date(2020, 2, 7)},
+      {"date_greater_equal": date(2020, 2, 8),
+       "date_less_equal": date(2020, 2, 10)}]),
+])
+def test_split_filters(kwargs, expected):
+    assert PointMeasurements._split_filters(**kwargs) == expected
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_fan_out(ordered):
+    """
+    Test the results of each query are combined
+    """
+    def method(site_name):
+        return gpd.GeoDataFrame({"site_name": [site_name] * 2})
+
+    filters = [{"site_name": s} for s in ["a", "b", "c"]]
+    result = PointMeasurements._fan_out(
+        method, filters, max_workers=2, ordered=ordered
+    )
+    assert len(result) == 6
+    if ordered:
+        assert list(result["site_name"]) == ["a", "a", "b", "b", "c", "c"]
+    else:
+        assert sorted(result["site_name"]) == ["a", "a", "b", "b", "c", "c"]
+
+
+def test_fan_out_call_tagging():
+    """
+    Test the work done in the threads is tagged with the calling API method
+    """
+    def method(site_name):
+        with query_stats.phase("fetch"):
+            return gpd.GeoDataFrame({"site_name": [site_name]})
+
+    query_stats.clear()
+    query_stats.enable()
+    try:
+        with query_stats.call("PointMeasurements.from_filter_parallel"):
+            PointMeasurements._fan_out(
+                method, [{"site_name": s} for s in "abc"], max_workers=3
+            )
+        calls = {r["call"] for r in query_stats.records}
+    finally:
+        query_stats.disable()
+        query_stats.clear()
+    assert calls == {"PointMeasurements.from_filter_parallel"}
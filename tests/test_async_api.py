@@ -0,0 +1,132 @@
+import asyncio
+import inspect
+from datetime import date
+
+import geopandas as gpd
+import pytest
+
+from snowexsql.async_api import (
+    AsyncLayerMeasurements, AsyncPointMeasurements, AsyncRasterMeasurements
+)
+from snowexsql.db import dispose_async_engines
+
+from .test_api import DBConnection, creds, data_dir, db_url  # noqa: F401
+
+
+def run(coroutine):
+    """
+    Run a coroutine on a fresh event loop and close its engines after
+    """
+    async def wrapped():
+        try:
+            return await coroutine
+        finally:
+            await dispose_async_engines()
+
+    return asyncio.run(wrapped())
+
+
+class TestAsyncPointMeasurements(DBConnection):
+    CLZ = AsyncPointMeasurements
+
+    def test_all_types(self, clz):
+        result = run(clz().all_types)
+        assert result == []
+
+    def test_from_filter(self, clz):
+        result = run(clz.from_filter(
+            date=date(2020, 5, 28), instrument='camera'
+        ))
+        assert len(result) == 0
+
+    @pytest.mark.parametrize("mode", ["guard", "estimate", "count"])
+    def test_size_check_modes(self, clz, mode):
+        class Extended(clz):
+            SIZE_CHECK_MODE = mode
+
+        result = run(Extended.from_filter(
+            date=date(2020, 5, 28), instrument='camera'
+        ))
+        assert len(result) == 0
+
+    def test_from_area_point(self, clz):
+        pts = gpd.points_from_xy([743766.4794971556], [4321444.154620216])
+        result = run(clz.from_area(
+            pt=pts[0], buffer=10, crs="26912", date=date(2019, 10, 30)
+        ))
+        assert len(result) == 0
+
+    def test_gather(self, clz):
+        """
+        Test several queries can share the loop
+        """
+        async def gather():
+            return await asyncio.gather(
+                clz.from_filter(date=date(2020, 5, 28), instrument='camera'),
+                clz().all_instruments
+            )
+
+        df, instruments = run(gather())
+        assert len(df) == 0
+        assert instruments == []
+
+
+class TestAsyncLayerMeasurements(DBConnection):
+    CLZ = AsyncLayerMeasurements
+
+    def test_from_filter(self, clz):
+        result = run(clz.from_filter(
+            type="density", site_id="COGM1N20_20200205"
+        ))
+        assert len(result) == 0
+
+
+class TestAsyncRasterMeasurements(DBConnection):
+    CLZ = AsyncRasterMeasurements
+
+    def test_from_filter(self, clz):
+        result = run(clz.from_filter(type="depth", date=date(2020, 2, 1)))
+        assert result == []
+
+    def test_from_area(self, clz):
+        shp = gpd.points_from_xy(
+            [743766.4794971556], [4321444.154620216], crs="epsg:26912"
+        ).buffer(100)[0]
+        result = run(clz.from_area(shp=shp, type="depth", resolution=50))
+        assert result == []
+
+
+@pytest.mark.parametrize("clz, name", [
+    (AsyncPointMeasurements, "from_filter_parallel"),
+    (AsyncPointMeasurements, "aggregate"),
+    (AsyncPointMeasurements, "iter_filter"),
+    (AsyncPointMeasurements, "nearest"),
+    (AsyncLayerMeasurements, "grid"),
+    (AsyncLayerMeasurements, "catalog"),
+    (AsyncRasterMeasurements, "datasets"),
+])
+def test_sync_only_methods(clz, name):
+    """
+    Test the methods without an asyncio version don't exist so they can't
+    run on the blocking engine
+    """
+    assert not hasattr(clz, name)
+    with pytest.raises(AttributeError, match="snowexsql.api"):
+        getattr(clz(), name)
+
+
+def test_public_methods_are_async():
+    """
+    Test every public query method left on the classes is a coroutine
+    """
+    safe = {"build_box", "retrieve_single_value_result", "extend_qry",
+            "clear_cache"}
+    for clz in [AsyncPointMeasurements, AsyncLayerMeasurements,
+                AsyncRasterMeasurements]:
+        for name in dir(clz):
+            if name.startswith("_") or name in safe or \
+                    not hasattr(clz, name):
+                continue
+            attr = inspect.getattr_static(clz, name)
+            if isinstance(attr, (classmethod, staticmethod)):
+                assert inspect.iscoroutinefunction(getattr(clz, name)), name
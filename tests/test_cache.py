@@ -0,0 +1,179 @@
+import os
+import time
+from datetime import date
+
+import geopandas as gpd
+import pytest
+from shapely.geometry import Point
+
+from snowexsql.cache import MetadataCache, ResultCache, freeze_kwargs
+
+
+@pytest.mark.parametrize("kwargs1, kwargs2, same", [
+    ({"type": "depth", "site_name": "Grand Mesa"},
+     {"site_name": "Grand Mesa", "type": "depth"}, True),
+    ({"type": ["depth", "swe"]}, {"type": ["swe", "depth"]}, True),
+    ({"type": "depth"}, {"type": "swe"}, False),
+])
+def test_freeze_kwargs(kwargs1, kwargs2, same):
+    """
+    Test the kwargs are hashable and independent of order
+    """
+    assert (freeze_kwargs(kwargs1) == freeze_kwargs(kwargs2)) == same
+    hash(freeze_kwargs(kwargs1))
+
+
+class TestMetadataCache:
+
+    def test_get_set(self):
+        cache = MetadataCache()
+        cache.set(("points", "a"), [1, 2])
+        assert cache.get(("points", "a")) == [1, 2]
+        assert cache.get(("points", "b")) is None
+
+    def test_lru_eviction(self):
+        cache = MetadataCache(maxsize=2)
+        cache.set(("points", "a"), 1)
+        cache.set(("points", "b"), 2)
+        # Touch a so b is the least recently used
+        cache.get(("points", "a"))
+        cache.set(("points", "c"), 3)
+        assert cache.get(("points", "b")) is None
+        assert cache.get(("points", "a")) == 1
+        assert len(cache) == 2
+
+    def test_ttl(self):
+        cache = MetadataCache(ttl=0.01)
+        cache.set(("points", "a"), 1)
+        time.sleep(0.02)
+        assert cache.get(("points", "a")) is None
+
+    def test_invalidate_table(self):
+        cache = MetadataCache()
+        cache.set(("points", "a"), 1)
+        cache.set(("layers", "a"), 2)
+        cache.invalidate("points")
+        assert cache.get(("points", "a")) is None
+        assert cache.get(("layers", "a")) == 2
+
+    def test_validate_fingerprint(self):
+        cache = MetadataCache(validate_interval=0)
+        fingerprint = [1]
+        cache.validate("points", lambda: fingerprint[0])
+        cache.set(("points", "a"), 1)
+
+        # Unchanged table keeps the entries
+        cache.validate("points", lambda: fingerprint[0])
+        assert cache.get(("points", "a")) == 1
+
+        # Changed table drops them
+        fingerprint[0] = 2
+        cache.validate("points", lambda: fingerprint[0])
+        assert cache.get(("points", "a")) is None
+
+    def test_validate_interval(self):
+        cache = MetadataCache(validate_interval=60)
+        calls = []
+        for i in range(3):
+            cache.validate("points", lambda: calls.append(i))
+        assert len(calls) == 1
+
+
+class TestResultCache:
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        pytest.importorskip("pyarrow")
+        return ResultCache(path=str(tmp_path))
+
+    @pytest.fixture
+    def df(self):
+        return gpd.GeoDataFrame(
+            {"value": [1.0, 2.0]},
+            geometry=gpd.points_from_xy([0, 1], [0, 1]), crs=26912
+        )
+
+    def test_make_key(self):
+        key = ResultCache.make_key(
+            ("db", "points"), "from_filter",
+            {"type": "depth", "date": date(2020, 2, 1)}
+        )
+        assert key == ResultCache.make_key(
+            ("db", "points"), "from_filter",
+            {"date": date(2020, 2, 1), "type": "depth"}
+        )
+        assert key != ResultCache.make_key(
+            ("db", "layers"), "from_filter",
+            {"type": "depth", "date": date(2020, 2, 1)}
+        )
+
+    def test_make_key_geometry(self):
+        keys = [
+            ResultCache.make_key(("db", "points"), "from_area", {}, [g])
+            for g in [Point(0, 0), Point(0, 1), None]
+        ]
+        assert len(set(keys)) == 3
+
+    def test_get_set(self, cache, df):
+        cache.set("a", (2, None), df)
+        result = cache.get("a", (2, None))
+        assert result.equals(df)
+        assert result.crs == df.crs
+        assert cache.get("b", (2, None)) is None
+
+    def test_fingerprint_changed(self, cache, df):
+        cache.set("a", (2, None), df)
+        assert cache.get("a", (3, None)) is None
+        # The stale result is removed
+        assert cache.get("a", (2, None)) is None
+
+    def test_set_replaces_data_first(self, cache, df, monkeypatch):
+        """
+        Test the fingerprint is only swapped in once the new data is, so
+        readers never pair it with older data
+        """
+        replaced = []
+        replace = os.replace
+
+        def record(src, dst):
+            replaced.append(os.path.splitext(dst)[1])
+            replace(src, dst)
+
+        monkeypatch.setattr(os, "replace", record)
+        cache.set("a", (2, None), df)
+        assert replaced == [".parquet", ".json"]
+
+    def test_fingerprint_throttled(self, cache):
+        """
+        Test the table fingerprint is only queried once per interval
+        """
+        calls = []
+
+        def fingerprint_func():
+            calls.append(1)
+            return (len(calls), None)
+
+        assert cache.fingerprint("points", fingerprint_func) == (1, None)
+        assert cache.fingerprint("points", fingerprint_func) == (1, None)
+        assert len(calls) == 1
+
+        cache._tables.validate_interval = 0
+        assert cache.fingerprint("points", fingerprint_func) == (2, None)
+
+    def test_lru_eviction(self, cache, df):
+        cache.set("a", (2, None), df)
+        cache.max_bytes = cache.size() * 2
+        cache.set("b", (2, None), df)
+        # Make a the most recently used
+        os.utime(os.path.join(cache.path, "b.parquet"), (0, 0))
+        cache.get("a", (2, None))
+        cache.set("c", (2, None), df)
+        assert cache.get("b", (2, None)) is None
+        assert cache.get("a", (2, None)) is not None
+        assert cache.get("c", (2, None)) is not None
+
+    def test_clear(self, cache, df):
+        cache.set("a", (2, None), df)
+        cache.clear()
+        assert cache.size() == 0
+        assert cache.get("a", (2, None)) is None
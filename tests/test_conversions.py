@@ -3,9 +3,17 @@ import shutil
 from os.path import isdir, join
 
 import pytest
-from sqlalchemy import func
+import shapely
+from rasterio.transform import from_origin
+from shapely.geometry import Point
+from sqlalchemy import func, select
 
 from snowexsql.conversions import *
+from snowexsql.conversions import (
+    _binary_geometry_statement, _rows_to_geopandas
+)
+from geoalchemy2.shape import from_shape
+from snowexsql.tables import ImageData, LayerData, PointData, SiteData
 from .sql_test_base import DBSetup
 
 
@@ -119,3 +127,157 @@ class TestConversionsOnDB(DBSetup):
         # Mean pulled from gdalinfo -stats be_gm1_0287/w001001x.adf
         np.testing.assert_approx_equal(v, 3058.005, significant=3)
 
+
+
+def test_rows_to_geopandas():
+    """
+    Test building a dataframe from result rows with WKB geometries
+    """
+    geom = shapely.set_srid(Point(743000, 4324500), 26912)
+    rows = [
+        (1, 2.0, shapely.to_wkb(geom, include_srid=True)),
+        (2, 3.0, None),
+    ]
+    df = _rows_to_geopandas(rows, ['id', 'value', 'geom'])
+
+    assert isinstance(df, gpd.GeoDataFrame)
+    assert df.crs.to_epsg() == 26912
+    assert df.geometry.iloc[0] == Point(743000, 4324500)
+    assert df['value'].sum() == 5.0
+
+
+def test_rows_to_geopandas_float_cols():
+    """
+    Test float columns stay numeric when every value is null
+    """
+    geom = shapely.set_srid(Point(743000, 4324500), 26912)
+    rows = [(None, shapely.to_wkb(geom, include_srid=True))]
+    df = _rows_to_geopandas(
+        rows, ['value_num', 'geom'], float_cols=['value_num']
+    )
+    assert df['value_num'].dtype == float
+
+
+@pytest.mark.parametrize("columns, expected_geom_cols", [
+    ([PointData], ['geom']),
+    ([PointData.id, PointData.value], []),
+    ([func.ST_Centroid(func.ST_Envelope(ImageData.raster))], ['ST_Centroid']),
+])
+def test_binary_geometry_statement(columns, expected_geom_cols):
+    """
+    Test geometry columns are selected as binary under their original names
+    """
+    statement = select(*columns)
+    binary, geom_cols = _binary_geometry_statement(statement)
+
+    assert geom_cols == expected_geom_cols
+    assert list(binary.selected_columns.keys()) == \
+        list(statement.selected_columns.keys())
+    for name in geom_cols:
+        assert 'ST_AsEWKB' in str(binary.selected_columns[name])
+
+
+@pytest.mark.parametrize("DataCls, kwargs", [
+    (PointData, dict(value=10.0, version_number=1)),
+    (LayerData, dict(value='250', depth=10.0)),
+    (SiteData, dict(pit_id='COGM1N20_20200205', total_depth=100.0)),
+])
+def test_points_to_geopandas_columnar(DataCls, kwargs):
+    """
+    Test converting records of any table to geopandas without a database
+    """
+    records = [
+        DataCls(
+            id=i, site_name='Grand Mesa',
+            geom=from_shape(Point(743000 + i, 4324500), srid=26912),
+            **kwargs
+        )
+        for i in range(3)
+    ]
+    records.append(DataCls(id=3, site_name='Grand Mesa', **kwargs))
+    df = points_to_geopandas(records)
+
+    assert isinstance(df, gpd.GeoDataFrame)
+    # Only the table columns come back
+    assert sorted(df.columns) == sorted(c.key for c in DataCls.__table__.c)
+    assert df.crs.to_epsg() == 26912
+    assert df.geometry.iloc[1] == Point(743001, 4324500)
+    assert df.geometry.iloc[3] is None
+    assert df['id'].dtype == np.int64
+    assert df['elevation'].dtype == float
+
+
+def make_tiff_buffer(arr, x=743000, y=4324500):
+    """
+    A small geotiff in memory like the ones returned by ST_AsTiff
+    """
+    with MemoryFile() as memfile:
+        with memfile.open(
+                driver='GTiff', width=arr.shape[1], height=arr.shape[0],
+                count=1, dtype=arr.dtype, crs='EPSG:26912', nodata=-9999,
+                transform=from_origin(x, y, 1, 1)
+        ) as dataset:
+            dataset.write(arr, 1)
+        return memoryview(memfile.read())
+
+
+@pytest.fixture
+def tiff_buffer():
+    return make_tiff_buffer(np.arange(12, dtype='float32').reshape(3, 4))
+
+
+def test_raster_to_rasterio_in_memory(tiff_buffer):
+    """
+    Test the datasets stay readable after conversion and skip empty rasters
+    """
+    datasets = raster_to_rasterio([(tiff_buffer,), (None,)])
+    assert len(datasets) == 1
+    assert datasets[0].read(1).sum() == 66
+    datasets[0].close()
+
+
+def test_raster_to_numpy(tiff_buffer):
+    """
+    Test getting the array and georeferencing without a dataset
+    """
+    arr, transform, crs = raster_to_numpy([(tiff_buffer,)])[0]
+    assert arr.shape == (1, 3, 4)
+    assert transform == from_origin(743000, 4324500, 1, 1)
+    assert crs.to_epsg() == 26912
+
+
+def test_merge_rasterio():
+    """
+    Test mosaicking neighboring tiles into one dataset
+    """
+    tiles = [
+        (make_tiff_buffer(np.full((3, 4), 1, dtype='float32')),),
+        (make_tiff_buffer(np.full((3, 4), 2, dtype='float32'), x=743004),),
+    ]
+    dataset = merge_rasterio(raster_to_rasterio(tiles))
+    arr = dataset.read(1)
+
+    assert arr.shape == (3, 8)
+    assert arr[:, :4].mean() == 1
+    assert arr[:, 4:].mean() == 2
+    assert dataset.transform == from_origin(743000, 4324500, 1, 1)
+    assert dataset.nodata == -9999
+
+
+def test_array_to_rasterio():
+    """
+    Test wrapping an array in a dataset with named bands
+    """
+    arr = np.stack([np.zeros((3, 4)), np.full((3, 4), np.nan)])
+    transform = from_origin(743000, 4324500, 100, 100)
+    dataset = array_to_rasterio(
+        arr, transform, 'EPSG:26912', nodata=np.nan,
+        descriptions=["count", "mean"]
+    )
+
+    assert dataset.count == 2
+    assert dataset.descriptions == ("count", "mean")
+    assert dataset.transform == transform
+    assert dataset.crs.to_epsg() == 26912
+    assert np.isnan(dataset.read(2)).all()
+    dataset.close()
@@ -1,10 +1,23 @@
+import asyncio
+from datetime import date
 from os.path import join
 
 import pytest
-from sqlalchemy import Table
+from sqlalchemy import MetaData, Table, create_mock_engine, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
 
-from snowexsql.db import get_db, get_table_attributes
-from snowexsql.tables import ImageData, LayerData, PointData, SiteData
+from snowexsql import db
+from snowexsql.api import PointMeasurements, RasterMeasurements
+from snowexsql.db import (
+    _partitioned_table, add_missing_columns, async_engines, check_indexes,
+    create_indexes, dispose_engines, get_async_engine, get_db, get_engine,
+    get_table_attributes, initialize, refresh_raster_catalog
+)
+from snowexsql.tables import (
+    ImageData, LayerData, PointData, RasterCatalog, SiteData
+)
+from snowexsql.tables.base import Base
 from .sql_test_base import DBSetup
 
 
@@ -72,8 +85,189 @@ class TestDB(DBSetup):
         for c in attributes:
             assert c in atts
 
+    def test_check_indexes(self):
+        """
+        Test the declared indexes are created with the tables
+        """
+        result = check_indexes(self.engine)
+        assert result["missing"] == []
+        assert "ix_points_type_date" in result["unused"]
+
+    def test_create_indexes(self):
+        """
+        Test a dropped index is reported and created again
+        """
+        with self.engine.connect() as conn:
+            conn.execute(text("DROP INDEX public.ix_layers_pit_id"))
+            conn.commit()
+
+        assert check_indexes(self.engine)["missing"] == ["ix_layers_pit_id"]
+        assert create_indexes(self.engine) == ["ix_layers_pit_id"]
+        assert check_indexes(self.engine)["missing"] == []
+
+    def test_add_missing_columns(self):
+        """
+        Test a generated column dropped from the database is added back
+        """
+        with self.engine.connect() as conn:
+            conn.execute(text(
+                "ALTER TABLE public.layers DROP COLUMN value_num"
+            ))
+            conn.commit()
+
+        assert add_missing_columns(self.engine) == ["layers.value_num"]
+        assert add_missing_columns(self.engine) == []
+        assert create_indexes(self.engine) == ["ix_layers_type_value_num"]
+
+    def test_value_num(self):
+        """
+        Test the numeric copy of layer values is generated by the database
+        """
+        self.session.add_all([
+            LayerData(value="250.5", type="density"),
+            LayerData(value="F", type="hand_hardness"),
+        ])
+        self.session.commit()
+        result = self.session.query(
+            LayerData.value_num
+        ).order_by(LayerData.id).all()
+        assert [r[0] for r in result] == [250.5, None]
+
+    def test_raster_catalog(self):
+        """
+        Test the catalog has a row per dataset once refreshed
+        """
+        self.session.add_all([
+            ImageData(type="depth", instrument="lidar", date=date(2020, 2, 1)),
+            ImageData(type="depth", instrument="lidar", date=date(2020, 2, 1)),
+            ImageData(type="swe", instrument="lidar", date=date(2020, 2, 1)),
+        ])
+        self.session.commit()
+        assert self.session.query(RasterCatalog).count() == 0
+
+        refresh_raster_catalog(self.engine)
+        result = self.session.query(
+            RasterCatalog.type, RasterCatalog.tiles
+        ).order_by(RasterCatalog.type).all()
+        assert result == [("depth", 2), ("swe", 1)]
+
+    def test_raster_catalog_stale(self):
+        """
+        Test the catalog isn't used until it's refreshed after an upload
+        """
+        self.session.add(ImageData(
+            type="depth", instrument="uavsar", date=date(2020, 2, 1)
+        ))
+        self.session.commit()
+        refresh_raster_catalog(self.engine)
+        qry = RasterMeasurements._current_catalog_query(
+            self.session.query(RasterCatalog.type), instrument="uavsar"
+        )
+        assert qry.all() == [("depth",)]
+
+        self.session.add(ImageData(
+            type="swe", instrument="uavsar", date=date(2020, 2, 1)
+        ))
+        self.session.commit()
+        assert qry.all() == []
+
+
+def test_drop_raster_catalog():
+    """
+    Test the catalog is dropped before the tables it depends on
+    """
+    statements = []
+    engine = create_mock_engine(
+        "postgresql://", lambda sql, *args, **kwargs: statements.append(
+            str(sql.compile(dialect=postgresql.dialect())).strip()
+        )
+    )
+    Base.metadata.drop_all(engine, checkfirst=False)
+    assert statements[0] == \
+        "DROP MATERIALIZED VIEW IF EXISTS public.raster_catalog"
+
+
+
+@pytest.mark.parametrize("DataCls, expected", [
+    (PointData, ["idx_points_geom", "ix_points_date_brin",
+                 "ix_points_type_date", "ix_points_geography"]),
+    (LayerData, ["idx_layers_geom", "ix_layers_pit_id",
+                 "ix_layers_geography"]),
+    (SiteData, ["idx_sites_geom", "ix_sites_site_id"]),
+    (ImageData, ["idx_images_raster", "ix_images_type_date"]),
+])
+def test_declared_indexes(DataCls, expected):
+    """
+    Test the filter and spatial indexes are declared on the tables
+    """
+    names = [idx.name for idx in DataCls.__table__.indexes]
+    for name in expected:
+        assert name in names
+
+
+class TestPartitionedDB(DBSetup):
+    """
+    Test the points and layers tables partitioned by water year
+    """
+
+    @classmethod
+    def setup_class(self):
+        super().setup_class()
+        initialize(self.engine, water_years=[2020, 2021])
+
+    def test_partitions(self):
+        with self.engine.connect() as conn:
+            partitions = conn.execute(text(
+                "SELECT inhrelid::regclass::text FROM pg_inherits"
+                " WHERE inhparent = 'public.points'::regclass"
+                " ORDER BY 1"
+            )).scalars().all()
+        assert partitions == [
+            "points_default", "points_wy2020", "points_wy2021"
+        ]
+
+    def test_indexes(self):
+        assert check_indexes(self.engine)["missing"] == []
+
+    def test_filter_prunes_partitions(self):
+        """
+        Test a date range from extend_qry only scans one partition
+        """
+        qry = self.session.query(PointMeasurements.MODEL)
+        qry = PointMeasurements.extend_qry(
+            qry, check_size=False, date_greater_equal=date(2020, 1, 1),
+            date_less_equal=date(2020, 3, 1)
+        )
+        sql = qry.statement.compile(
+            dialect=postgresql.dialect(),
+            compile_kwargs={"literal_binds": True}
+        )
+        with self.engine.connect() as conn:
+            plan = "\n".join(conn.execute(
+                text(f"EXPLAIN {sql}")
+            ).scalars())
+        assert "points_wy2020" in plan
+        assert "points_wy2021" not in plan
+        assert "points_default" not in plan
+
 
 # Independent Tests
+@pytest.mark.filterwarnings("error")
+def test_partitioned_table():
+    """
+    Test the partitioned copy of a table keeps the date in its key without
+    any warnings from sqlalchemy
+    """
+    table = _partitioned_table(PointData.__table__, MetaData())
+    sql = str(CreateTable(table).compile(dialect=postgresql.dialect()))
+    assert "PARTITION BY RANGE (date)" in sql
+    assert "PRIMARY KEY (id, date)" in sql
+    assert "id SERIAL" in sql
+    # The model is untouched
+    assert list(PointData.__table__.primary_key.columns.keys()) == ["id"]
+    assert not PointData.__table__.c.date.primary_key
+
+
 @pytest.mark.parametrize("return_metadata, expected_objs", [
     (False, 2),
     (True, 3)])
@@ -84,3 +278,56 @@ def test_getting_db(return_metadata, expected_objs):
 
     result = get_db('builder:db_builder@localhost/test', return_metadata=return_metadata)
     assert len(result) == expected_objs
+
+
+def test_getting_pooled_db():
+    """
+    Test the pooled connection shares the engine from the registry
+    """
+    engine, session = get_db('builder:db_builder@localhost/test', pooled=True)
+    assert engine is get_engine('builder:db_builder@localhost/test')
+    session.close()
+
+
+@pytest.mark.parametrize("kwargs, same_engine", [
+    ({}, True),
+    ({"pool_size": 2}, False),
+    ({"pool_pre_ping": False}, False),
+])
+def test_engine_registry(kwargs, same_engine):
+    """
+    Test engines are reused by connection string and pool settings
+    """
+    db_str = 'builder:db_builder@localhost/test'
+    engine = get_engine(db_str)
+    assert (get_engine(db_str, **kwargs) is engine) == same_engine
+
+
+def test_dispose_engines():
+    """
+    Test disposing of the registry hands out a fresh engine afterwards
+    """
+    db_str = 'builder:db_builder@localhost/test'
+    engine = get_engine(db_str)
+    dispose_engines()
+    assert get_engine(db_str) is not engine
+
+
+def test_async_engines_disposed():
+    """
+    Test each event loop gets its own engine, disposed on leaving
+    async_engines
+    """
+    pytest.importorskip("asyncpg")
+    db_str = 'builder:db_builder@localhost/test'
+
+    async def engine():
+        async with async_engines():
+            first = get_async_engine(db_str)
+            assert get_async_engine(db_str) is first
+            assert len(db._ASYNC_ENGINES) == 1
+        assert len(db._ASYNC_ENGINES) == 0
+        return first
+
+    engines = [asyncio.run(engine()) for _ in range(2)]
+    assert engines[0] is not engines[1]
@@ -0,0 +1,123 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from snowexsql.stats import QueryStats, instrumented, query_stats
+
+
+@pytest.fixture
+def stats():
+    query_stats.clear()
+    query_stats.enable()
+    yield query_stats
+    query_stats.disable()
+    query_stats.clear()
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    query_stats.watch(engine)
+    return engine
+
+
+def test_statement_records(stats, engine):
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1")).all()
+
+    record = stats.records[-1]
+    assert record["kind"] == "statement"
+    assert record["name"] == "SELECT"
+    assert record["statement"] == "SELECT 1"
+    assert record["duration"] >= 0
+
+
+def test_unwatched_engine(stats):
+    """
+    Test only the watched engines, e.g. the registry's, are timed
+    """
+    with create_engine("sqlite://").connect() as conn:
+        conn.execute(text("SELECT 1")).all()
+    assert len(stats.records) == 0
+
+
+def test_watch_while_enabled(stats):
+    """
+    Test an engine created while recording is timed right away
+    """
+    engine = create_engine("sqlite://")
+    stats.watch(engine)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1")).all()
+    assert stats.records[-1]["statement"] == "SELECT 1"
+
+
+def test_disabled(engine):
+    stats = QueryStats()
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1")).all()
+    with stats.phase("decode") as info:
+        info["rows"] = 1
+    assert len(stats.records) == 0
+
+
+def test_phase(stats):
+    with stats.phase("decode") as info:
+        info["rows"] = 10
+    record = stats.records[-1]
+    assert record["kind"] == "phase"
+    assert record["name"] == "decode"
+    assert record["rows"] == 10
+
+
+def test_instrumented(stats, engine):
+    class Dataset:
+        @classmethod
+        @instrumented
+        def from_filter(cls):
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1")).all()
+            with stats.phase("decode"):
+                pass
+
+    Dataset.from_filter()
+    kinds = [(r["kind"], r["name"], r["call"]) for r in stats.records]
+    assert kinds == [
+        ("statement", "SELECT", "Dataset.from_filter"),
+        ("phase", "decode", "Dataset.from_filter"),
+        ("call", "Dataset.from_filter", "Dataset.from_filter"),
+    ]
+    summary = stats.summary()
+    assert summary.loc[("call", "Dataset.from_filter"), "count"] == 1
+
+
+def test_callback(stats):
+    received = []
+    stats.enable(callback=received.append)
+    with stats.phase("decode"):
+        pass
+    assert received[0]["name"] == "decode"
+
+
+def test_callback_failure(stats):
+    """
+    Test a broken callback doesn't break the work being timed
+    """
+    def callback(record):
+        raise RuntimeError("metrics are down")
+
+    stats.enable(callback=callback)
+    with stats.phase("decode"):
+        pass
+    assert len(stats.records) == 1
+
+
+def test_explain_failure(stats, engine):
+    """
+    Test a statement that can't be explained is still recorded
+    """
+    stats.enable(explain_threshold=0)
+    with engine.connect() as conn:
+        result = conn.execute(text("SELECT 1")).all()
+
+    assert result == [(1,)]
+    assert stats.records[-1]["plan"] is None